@@ -0,0 +1,98 @@
+"""
+This module implements animation clips shared by every entity of a
+character type, indexed by integer states.
+"""
+from functools import lru_cache
+from typing import List
+import os
+import numpy as np
+import pygame
+from utils import load_graphics
+
+
+FACINGS = ('up', 'down', 'left', 'right')
+ACTIONS = ('move', 'idle', 'attack')
+MOVE, IDLE, ATTACK = range(len(ACTIONS))  # action ids, add to a facing state
+N_STATES = len(FACINGS) * len(ACTIONS)
+FACING_STATE = {  # facing -> state id of moving that way
+    facing: idx * len(ACTIONS) for idx, facing in enumerate(FACINGS)
+}
+CLIP_NAMES = [  # state id -> clip directory name (ex: 'up_idle')
+    facing if action == 'move' else f'{facing}_{action}'
+    for facing in FACINGS for action in ACTIONS
+]
+CLIP_FPS = 5  # default animation speed, frames per second
+FRAME_EPSILON = 1e-6  # frames, absorbs rounding errors of summed time steps
+
+
+def clip_dirs(path: str) -> List[str]:
+    """ List the clip directories of a character, in state id order.
+
+    :param path: directory with one subdirectory per clip (see CLIP_NAMES)
+    :type  path: str
+    :return:     paths to clip directories
+    :rtype:      List[str]
+    """
+    return [os.path.join(path, name) for name in CLIP_NAMES]
+
+
+class ClipLibrary:
+    """ Animation clips of one character type, one per state.
+
+        A state id is FACING_STATE[facing] + action (MOVE, IDLE or ATTACK).
+        Entities playing these clips only need a state id and an animation
+        time, the frames and their timing are looked up here.
+    """
+    def __init__(self, path: str, fps: float = CLIP_FPS) -> None:
+        """ Constructor. Loads every clip.
+
+            :param path: directory with one subdirectory per clip
+            :type  path: str
+            :param fps:  animation speed in frames per second
+            :type  fps:  float, optional
+        """
+        self.path = path
+        self.frames = [load_graphics(clip) for clip in clip_dirs(path)]
+        self.length = np.array([len(frames) for frames in self.frames],
+                               dtype=np.int32)  # state id -> frames
+        self.fps = np.full(N_STATES, float(fps))  # state id -> frames/sec
+        self.duration = self.length / self.fps  # state id -> seconds/loop
+
+    def frame_index(self, state: int, time: float) -> int:
+        """ Get which frame of a clip shows at some point of the animation.
+
+            :param state: state id
+            :type  state: int
+            :param time:  seconds since the animation started, it loops
+            :type  time:  float
+            :return:      index into the clip's frames
+            :rtype:       int
+        """
+        return int(time * self.fps[state] + FRAME_EPSILON) % \
+            int(self.length[state])
+
+    def image(self, state: int, time: float) -> pygame.Surface:
+        """ Get the frame of a clip that shows at some point of the animation.
+
+            :param state: state id
+            :type  state: int
+            :param time:  seconds since the animation started, it loops
+            :type  time:  float
+            :return:      animation frame, shared so do not draw onto it
+            :rtype:       pygame.Surface
+        """
+        return self.frames[state][self.frame_index(state, time)]
+
+
+@lru_cache(maxsize=None)
+def load_clips(path: str, fps: float = CLIP_FPS) -> ClipLibrary:
+    """ Load the clips of a character type, once per process.
+
+    :param path: directory with one subdirectory per clip (see CLIP_NAMES)
+    :type  path: str
+    :param fps:  animation speed in frames per second
+    :type  fps:  float, optional
+    :return:     clip library shared by every caller
+    :rtype:      ClipLibrary
+    """
+    return ClipLibrary(path, fps)
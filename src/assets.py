@@ -0,0 +1,144 @@
+"""
+This module implements a shared cache for image assets.
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import os
+import pygame
+from memory import MEMORY
+from render import DISPLAY
+
+
+class AssetCache:
+    """ Load each image from disk once, convert it and share the surface.
+
+        Surfaces are kept in least-recently-used order. If a memory budget is
+        set, the least recently used surfaces are dropped from the cache once
+        the cached pixels exceed it (sprites still holding them keep them).
+    """
+    def __init__(self, budget: Optional[int] = None) -> None:
+        """ Constructor.
+
+            :param budget: max bytes of cached pixels, defaults to no limit
+            :type  budget: int, optional
+        """
+        self.budget = budget
+        self.surfaces = OrderedDict()  # (path, alpha) -> surface, LRU first
+        self.size = 0  # bytes of cached pixels
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    @staticmethod
+    def key(path: str, alpha: bool = True) -> Tuple[str, bool]:
+        """ Create cache key for an image file.
+
+            :param path:  path to image file
+            :type  path:  str
+            :param alpha: whether the surface keeps per-pixel alpha
+            :type  alpha: bool, optional
+            :return:      cache key
+            :rtype:       Tuple[str, bool]
+        """
+        return os.path.normpath(path), alpha
+
+    @staticmethod
+    def nbytes(surface: pygame.Surface) -> int:
+        """ Get number of bytes of pixel data in a surface.
+
+            :param surface: surface to measure
+            :type  surface: pygame.Surface
+            :return:        bytes of pixel data
+            :rtype:         int
+        """
+        return surface.get_pitch() * surface.get_height()
+
+    def image(self, path: str, alpha: bool = True) -> pygame.Surface:
+        """ Get image file as a display-converted surface, loading on miss.
+
+            :param path:  path to image file
+            :type  path:  str
+            :param alpha: keep per-pixel alpha (convert_alpha vs convert)
+            :type  alpha: bool, optional
+            :return:      shared surface, do not draw onto it
+            :rtype:       pygame.Surface
+        """
+        key = self.key(path, alpha)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        return self.insert(path, pygame.image.load(path), alpha)
+
+    def insert(self,
+               path: str,
+               surface: pygame.Surface,
+               alpha: bool = True) -> pygame.Surface:
+        """ Convert a freshly loaded image and cache it (counts as a miss).
+
+            Loading can happen elsewhere (ex: a worker thread), but this must
+            run on the main thread since converting needs the display (see
+            render).
+
+            :param path:    path the image was loaded from
+            :type  path:    str
+            :param surface: image as loaded, not yet converted
+            :type  surface: pygame.Surface
+            :param alpha:   keep per-pixel alpha (convert_alpha vs convert)
+            :type  alpha:   bool, optional
+            :return:        shared surface, do not draw onto it
+            :rtype:         pygame.Surface
+        """
+        self.misses += 1
+        surface = DISPLAY.get().prepare(surface, alpha)
+        self.put(self.key(path, alpha), surface)
+        return surface
+
+    def put(self, key: Tuple[str, bool], surface: pygame.Surface) -> None:
+        """ Add a surface to the cache, evicting others if over budget.
+
+            :param key:     cache key (see key)
+            :type  key:     Tuple[str, bool]
+            :param surface: surface to cache
+            :type  surface: pygame.Surface
+        """
+        self.release(*key)
+        self.surfaces[key] = MEMORY.track(surface, os.path.dirname(key[0]))
+        self.size += self.nbytes(surface)
+        while self.budget is not None and self.size > self.budget and \
+                len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.size -= self.nbytes(evicted)
+            self.evictions += 1
+
+    def release(self, path: str, alpha: bool = True) -> None:
+        """ Drop an image from the cache (ex: after it got baked elsewhere).
+
+            :param path:  path to image file
+            :type  path:  str
+            :param alpha: whether the surface keeps per-pixel alpha
+            :type  alpha: bool, optional
+        """
+        surface = self.surfaces.pop(self.key(path, alpha), None)
+        if surface is not None:
+            self.size -= self.nbytes(surface)
+
+    def stats(self) -> Dict[str, int]:
+        """ Get cache counters.
+
+            A miss means a disk read, so misses should stop growing once the
+            level is loaded.
+
+            :return: hits, misses, evictions, cached surfaces and bytes
+            :rtype:  Dict[str, int]
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'surfaces': len(self.surfaces),
+            'bytes': self.size
+        }
+
+
+ASSETS = AssetCache()  # shared by every module that draws images
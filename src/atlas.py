@@ -0,0 +1,206 @@
+"""
+This module implements texture atlases that pack many small images into one.
+
+Run it as a script (from this directory) to pack the atlases:
+    python atlas.py
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+from glob import glob
+import pygame
+from assets import ASSETS
+from memory import MEMORY
+
+
+ATLAS_DIR = '../graphics/atlas'
+ATLAS_WIDTH = 1024  # pixels, atlases grow downward
+ATLAS_PADDING = 1   # pixels between packed images
+Rect = Tuple[int, int, int, int]
+
+
+def source_files(path: str) -> List[str]:
+    """ List PNG files in a directory in a stable (sorted) order.
+
+    :param path: path to directory with PNG files
+    :type  path: str
+    :return:     sorted PNG file paths
+    :rtype:      List[str]
+    """
+    return sorted(glob(os.path.join(path, '*.png')))
+
+
+def shelf_pack(sizes: List[Tuple[int, int]],
+               width: int) -> Tuple[List[Rect], int]:
+    """ Place rectangles on shelves (rows) of a fixed-width sheet.
+
+    :param sizes: (width, height) of each rectangle
+    :type  sizes: List[Tuple[int, int]]
+    :param width: sheet width in pixels
+    :type  width: int
+    :return:      (x, y, w, h) of each rectangle in input order, sheet height
+    :rtype:       Tuple[List[Rect], int]
+    """
+    # tallest first so each shelf wastes little height
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    rects = [None] * len(sizes)
+    x_pixel, y_pixel, shelf_height = 0, 0, 0
+    for idx in order:
+        rect_w, rect_h = sizes[idx]
+        if x_pixel + rect_w > width:  # start a new shelf
+            x_pixel, y_pixel = 0, y_pixel + shelf_height + ATLAS_PADDING
+            shelf_height = 0
+        rects[idx] = (x_pixel, y_pixel, rect_w, rect_h)
+        x_pixel += rect_w + ATLAS_PADDING
+        shelf_height = max(shelf_height, rect_h)
+    return rects, y_pixel + shelf_height
+
+
+def pack(name: str, paths: List[str]) -> None:
+    """ Pack PNG files of several directories into one atlas image + index.
+
+    :param name:  atlas name, used for the output file names
+    :type  name:  str
+    :param paths: directories with PNG files to pack
+    :type  paths: List[str]
+    """
+    files = {path: source_files(path) for path in paths}
+    images = [
+        pygame.image.load(file) for path in paths for file in files[path]
+    ]
+    width = max([ATLAS_WIDTH] + [image.get_width() for image in images])
+    rects, height = shelf_pack([image.get_size() for image in images], width)
+
+    # pylint: disable=no-member
+    sheet = pygame.Surface((width, height), pygame.SRCALPHA)
+    # pylint: enable=no-member
+    for image, rect in zip(images, rects):
+        sheet.blit(image, rect[:2])
+
+    index, start = {}, 0
+    for path in paths:
+        stop = start + len(files[path])
+        index[os.path.normpath(path)] = {
+            'files': [os.path.basename(file) for file in files[path]],
+            'rects': rects[start:stop]
+        }
+        start = stop
+
+    os.makedirs(ATLAS_DIR, exist_ok=True)
+    pygame.image.save(sheet, os.path.join(ATLAS_DIR, f'{name}.png'))
+    with open(os.path.join(ATLAS_DIR, f'{name}.json'), 'w',
+              encoding='utf-8') as file:
+        json.dump(index, file, indent=1)
+
+
+class AtlasIndex:
+    """ Lookup of atlas frames by the directory they were packed from. """
+    def __init__(self, atlas_dir: str = ATLAS_DIR) -> None:
+        """ Constructor.
+
+            :param atlas_dir: directory with packed atlases
+            :type  atlas_dir: str, optional
+        """
+        self.entries = {}  # source dir -> (atlas image path, entry)
+        for index_file in sorted(glob(os.path.join(atlas_dir, '*.json'))):
+            image_file = index_file[:-len('.json')] + '.png'
+            if not os.path.exists(image_file):
+                continue
+            with open(index_file, 'r', encoding='utf-8') as file:
+                for path, entry in json.load(file).items():
+                    self.entries[path] = (image_file, entry)
+        self.frames = {}  # source dir -> list of subsurfaces
+
+    def is_current(self, path: str) -> bool:
+        """ Check that the atlas still matches the PNG files of a directory.
+
+            :param path: directory the frames were packed from
+            :type  path: str
+            :return:     whether the packed frames can be used
+            :rtype:      bool
+        """
+        image_file, entry = self.entries[os.path.normpath(path)]
+        files = source_files(path)
+        packed_time = os.path.getmtime(image_file)
+        return [os.path.basename(file) for file in files] == entry['files'] \
+            and all(os.path.getmtime(file) <= packed_time for file in files)
+
+    def image_file(self, path: str) -> Optional[str]:
+        """ Get the atlas image holding the frames packed from a directory.
+
+            :param path: directory the frames were packed from
+            :type  path: str
+            :return:     atlas image path, None if not packed or outdated
+            :rtype:      Optional[str]
+        """
+        path = os.path.normpath(path)
+        if path not in self.entries or not self.is_current(path):
+            return None
+        return self.entries[path][0]
+
+    def get(self, path: str) -> Optional[List[pygame.Surface]]:
+        """ Get the frames packed from a directory, in sorted file order.
+
+            :param path: directory the frames were packed from
+            :type  path: str
+            :return:     atlas subsurfaces, None if not packed or outdated
+            :rtype:      Optional[List[pygame.Surface]]
+        """
+        path = os.path.normpath(path)
+        if path not in self.frames:
+            image_file = self.image_file(path)
+            if image_file is None:
+                return None
+            sheet = ASSETS.image(image_file)
+            entry = self.entries[path][1]
+            self.frames[path] = [
+                MEMORY.track(sheet.subsurface(rect), path)
+                for rect in entry['rects']
+            ]
+        return self.frames[path]
+
+
+@lru_cache(maxsize=None)
+def atlas_index() -> AtlasIndex:
+    """ Get the index of packed atlases, reading it on first use.
+
+    :return: index of the atlases in ATLAS_DIR
+    :rtype:  AtlasIndex
+    """
+    return AtlasIndex(ATLAS_DIR)
+
+
+def atlas_frames(path: str) -> Optional[List[pygame.Surface]]:
+    """ Get the frames packed from a directory if an up-to-date atlas exists.
+
+    :param path: directory with PNG files
+    :type  path: str
+    :return:     atlas subsurfaces, None if the directory is not packed
+    :rtype:      Optional[List[pygame.Surface]]
+    """
+    return atlas_index().get(path)
+
+
+def atlas_sources() -> Dict[str, List[str]]:
+    """ List the directories to pack, by atlas, from where the game loads
+    its graphics.
+
+    :return: atlas name -> directories with PNG files
+    :rtype:  Dict[str, List[str]]
+    """
+    # pylint: disable=import-outside-toplevel,cyclic-import
+    # those modules load their graphics through this one
+    from animation import clip_dirs
+    from levels import OBJECT_GRAPHICS
+    from player import PLAYER_GRAPHICS
+    # pylint: enable=import-outside-toplevel,cyclic-import
+    return {
+        'player': clip_dirs(PLAYER_GRAPHICS),
+        'objects': [OBJECT_GRAPHICS]
+    }
+
+
+if __name__ == '__main__':
+    for atlas_name, atlas_paths in atlas_sources().items():
+        pack(atlas_name, atlas_paths)
@@ -0,0 +1,290 @@
+"""
+This module implements a headless benchmark of map loading, drawing and
+collision, on the real map and on larger maps made by tiling it.
+
+Run it from this directory, ex:
+    python bench.py --scales 1 4 16 --frames 600 --output bench.json
+"""
+from math import isqrt
+from time import perf_counter
+from typing import Dict, List
+import argparse
+import os
+import platform
+import random
+import subprocess
+import numpy as np
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no window or GPU needed
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # stdout is JSON
+# pylint: disable=wrong-import-position
+import pygame
+from animation import FACING_STATE, MOVE
+from controls import CONTROLS, KeyState
+from levels import Level, TILE_SIZE
+from main import WIDTH, HEIGHT, SIM_RATE
+from memory import MEMORY
+from profiler import PROFILER
+from render import DISPLAY, RENDER_BACKEND, RENDER_BACKENDS
+from utils import write_json
+# pylint: enable=wrong-import-position
+
+
+BENCH_SCALES = [1, 4, 16]  # map area multipliers, must be square numbers
+BENCH_FRAMES = 600
+SEGMENT_FRAMES = 20  # frames between changes of scripted movement direction
+MOVE_KEYS = ['K_RIGHT', 'K_DOWN', 'K_LEFT', 'K_UP']
+WANDER_SPEED = 150  # pixels per second
+
+
+def waypoints(level: Level, count: int) -> List[tuple]:
+    """ Spread player start points evenly over the map in a zig-zag.
+
+    :param level: level to spread points over
+    :type  level: Level
+    :param count: number of points
+    :type  count: int
+    :return:      (x, y) points in world pixels
+    :rtype:       List[tuple]
+    """
+    rows, cols = level.map_size
+    side = max(1, isqrt(count))
+    points = []
+    for row in range(side):
+        order = range(side) if row % 2 == 0 else reversed(range(side))
+        for col in order:
+            points.append((
+                int((col + 0.5) * cols * TILE_SIZE / side),
+                int((row + 0.5) * rows * TILE_SIZE / side)
+            ))
+    return points[:count]
+
+
+def teleport(level: Level, point: tuple) -> None:
+    """ Move the player to a point without collision checks.
+
+    :param level: level with the player
+    :type  level: Level
+    :param point: (x, y) in world pixels for the player's hitbox center
+    :type  point: tuple
+    """
+    player = level.player
+    player.hitbox.center = point
+    level.entities.place(player.eid, player.hitbox)
+    player.rect.center = player.hitbox.center
+    player.old_rect = player.rect.copy()
+
+
+def spawn_wanderers(level: Level, count: int) -> np.ndarray:
+    """ Add entities on random free map cells, drawn from the entity store.
+
+    :param level: level to add entities to
+    :type  level: Level
+    :param count: number of entities
+    :type  count: int
+    :return:      entity ids
+    :rtype:       np.ndarray
+    """
+    grid = level.collision_grid
+    free_rows, free_cols = np.nonzero((grid.cells == 0) &
+                                      (grid.box_count == 0))
+    clips, state = level.player.clips, FACING_STATE['down'] + MOVE
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(free_rows), count)
+    # out of step with each other, like a crowd
+    anim_times = rng.uniform(0, clips.duration[state], count)
+    return np.array([
+        level.entities.add(
+            pygame.Rect(int(free_cols[pick]) * TILE_SIZE,
+                        int(free_rows[pick]) * TILE_SIZE, 48, 32),
+            WANDER_SPEED, clips, state, anim_time
+        )
+        for pick, anim_time in zip(picks.tolist(), anim_times.tolist())
+    ], dtype=int)
+
+
+def steer_wanderers(level: Level,
+                    eids: np.ndarray,
+                    rng: np.random.Generator) -> None:
+    """ Point entities in random directions (or stop them).
+
+    :param level: level with the entities
+    :type  level: Level
+    :param eids:  entity ids
+    :type  eids:  np.ndarray
+    :param rng:   random source
+    :type  rng:   np.random.Generator
+    """
+    level.entities.direction[eids] = rng.integers(-1, 2, (len(eids), 2))
+
+
+def chase_player(level: Level, eids: np.ndarray) -> None:
+    """ Point entities along the flow field toward the player.
+
+    :param level: level with the entities
+    :type  level: Level
+    :param eids:  entity ids
+    :type  eids:  np.ndarray
+    """
+    with PROFILER.section('navigation'):
+        field = level.navigation.track('player', level.player.hitbox.center)
+        hitbox = level.entities.hitbox[eids]
+        level.entities.direction[eids] = field.directions(
+            hitbox[:, :2] + hitbox[:, 2:] // 2
+        )
+
+
+def run_scale(scale: int,
+              frames: int,
+              bake_static: bool,
+              dirty_only: bool,
+              stream: bool,
+              wanderers: int = 0,
+              chase: bool = False) -> Dict:
+    """ Benchmark one map scale.
+
+    The player walks a square (right, down, left, up) and hops across the
+    map every few segments so drawing and collision see the whole map.
+
+    :param scale:       map area multiplier, a square number
+    :type  scale:       int
+    :param frames:      number of frames to run
+    :type  frames:      int
+    :param bake_static: composite flat visible tiles into floor chunks
+    :type  bake_static: bool
+    :param dirty_only:  only redraw and present areas that changed
+    :type  dirty_only:  bool
+    :param stream:      only keep map regions near the player loaded
+    :type  stream:      bool
+    :param wanderers:   entities to add that walk around randomly
+    :type  wanderers:   int, optional
+    :param chase:       make the wanderers chase the player instead
+    :type  chase:       bool, optional
+    :return:            results for this scale
+    :rtype:             Dict
+    """
+    assert isqrt(scale) ** 2 == scale, 'scale must be a square number'
+    random.seed(0)  # same grass variants every run
+    PROFILER.reset()
+    start = perf_counter()
+    level = Level(bake_static=bake_static, stream=stream,
+                  map_repeats=isqrt(scale))
+    load_time = perf_counter() - start
+    create_map_time = PROFILER.current.pop('create_map', 0.0)
+    MEMORY.reset()
+
+    step = 1 / SIM_RATE
+    points = waypoints(level, max(1, frames // (4 * SEGMENT_FRAMES)))
+    wanderer_ids = spawn_wanderers(level, wanderers)
+    rng = np.random.default_rng(0)
+    start = perf_counter()
+    for frame in range(frames):
+        segment = frame // SEGMENT_FRAMES
+        if frame % (4 * SEGMENT_FRAMES) == 0:
+            teleport(level, points[segment // 4 % len(points)])
+        if chase:
+            chase_player(level, wanderer_ids)
+        elif frame % SEGMENT_FRAMES == 0:
+            steer_wanderers(level, wanderer_ids, rng)
+        CONTROLS.keys = KeyState.of(  # scripted input
+            [getattr(pygame, MOVE_KEYS[segment % 4])]
+        )
+        with PROFILER.section('frame'):
+            level.update(step)
+            areas = level.draw(dirty_only=dirty_only)
+            with PROFILER.section('present'):
+                DISPLAY.get().present(areas)
+        PROFILER.end_frame()
+        MEMORY.end_frame()
+    run_time = perf_counter() - start
+
+    return {
+        'scale': scale,
+        'map_size': list(level.map_size),
+        'bake_static': bake_static,
+        'dirty_only': dirty_only,
+        'stream': level.streamer.stats() if stream else None,
+        'visible_sprites': len(level.visible_sprites),
+        'obstacle_sprites': len(level.obstacle_sprites),
+        'wanderers': wanderers,
+        'navigation': level.navigation.stats() if chase else None,
+        'blocked_cells': level.collision_grid.count(),
+        'load_s': load_time,
+        'create_map_ms': create_map_time,
+        'frames': frames,
+        'fps': frames / run_time,
+        'phases_ms': PROFILER.stats(),
+        'surfaces': MEMORY.report() if MEMORY.enabled else None
+    }
+
+
+def git_commit() -> str:
+    """ Get the current git commit hash, if available. """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main() -> None:
+    """ Run benchmark from the command line. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scales', type=int, nargs='+',
+                        default=BENCH_SCALES,
+                        help='map area multipliers (square numbers)')
+    parser.add_argument('--frames', type=int, default=BENCH_FRAMES,
+                        help='frames to run per scale')
+    parser.add_argument('--bake', action='store_true',
+                        help='composite flat tiles into floor chunks')
+    parser.add_argument('--dirty', action='store_true',
+                        help='only redraw and present areas that changed')
+    parser.add_argument('--stream', action='store_true',
+                        help='only keep map regions near the player loaded')
+    parser.add_argument('--wanderers', type=int, default=0,
+                        help='entities to add that walk around randomly')
+    parser.add_argument('--chase', action='store_true',
+                        help='make the wanderers chase the player along a '
+                             'shared flow field')
+    parser.add_argument('--memory', action='store_true',
+                        help='report surface memory by origin')
+    parser.add_argument('--renderer', choices=RENDER_BACKENDS,
+                        default=RENDER_BACKEND,
+                        help='render backend to draw with')
+    parser.add_argument('--render-scale', type=float, default=1.0,
+                        help='draw the world at this fraction of the window '
+                             'resolution, then scale it up')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    # pylint: disable=no-member
+    pygame.init()
+    # pylint: enable=no-member
+    DISPLAY.open((WIDTH, HEIGHT), args.renderer)
+    DISPLAY.scale = args.render_scale
+    PROFILER.enabled = True
+    PROFILER.window = args.frames
+    MEMORY.enabled = args.memory
+    results = [
+        run_scale(scale, args.frames, args.bake, args.dirty, args.stream,
+                  args.wanderers, args.chase)
+        for scale in args.scales
+    ]
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'video_driver': pygame.display.get_driver(),
+        'renderer': args.renderer,
+        'render_scale': args.render_scale,
+        'results': results
+    }
+    write_json(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+This module implements a packed grid of blocked map cells for collisions.
+"""
+from typing import List, Tuple
+import numpy as np
+import pygame
+from group import grid_cells
+from tile import TILE_SIZE, HITBOX_INFLATE
+
+
+BOXES_PER_CELL = 4  # obstacle hitboxes per cell to start with, grows
+
+
+class CollisionGrid:
+    """ Everything entities collide with, in arrays for batched tests.
+
+        Invisible obstacles (ex: map boundary) are one byte per map cell,
+        instead of a sprite and a surface each, and each blocked cell
+        collides like a Tile's hitbox would. Obstacle sprites have their
+        hitboxes copied into a table of boxes per cell (see ObstacleGroup).
+    """
+    def __init__(self,
+                 shape: Tuple[int, int],
+                 cell_size: int = TILE_SIZE) -> None:
+        """ Constructor.
+
+            :param shape:     rows, columns of cells
+            :type  shape:     Tuple[int, int]
+            :param cell_size: width and height of a cell in pixels
+            :type  cell_size: int, optional
+        """
+        self.cell_size = cell_size
+        self.cells = np.zeros(shape, dtype=np.uint8)  # 1 where blocked
+        self.lookup = memoryview(self.cells)  # faster single-cell reads
+        self.bounds = pygame.Rect(0, 0, shape[1] * cell_size,
+                                  shape[0] * cell_size)
+        # hitbox of a blocked cell, relative to the cell's top-left corner
+        self.cell_box = pygame.Rect(0, 0, cell_size, cell_size).inflate(
+            HITBOX_INFLATE
+        )
+        # (x, y, w, h) of obstacle hitboxes overlapping each cell, zero-sized
+        # past the cell's count
+        self.boxes = np.zeros(shape + (BOXES_PER_CELL, 4), dtype=np.int32)
+        self.box_count = np.zeros(shape, dtype=np.int32)
+
+    def block(self, rows: slice, cols: slice, blocked: np.ndarray) -> None:
+        """ Mark cells of part of the grid as blocked.
+
+            :param rows:    grid rows to update
+            :type  rows:    slice
+            :param cols:    grid columns to update
+            :type  cols:    slice
+            :param blocked: which of those cells are blocked (rows x columns)
+            :type  blocked: np.ndarray
+        """
+        self.cells[rows, cols] |= blocked.astype(np.uint8)
+
+    def clear(self, rows: slice, cols: slice) -> None:
+        """ Mark cells of part of the grid as free.
+
+            :param rows: grid rows to update
+            :type  rows: slice
+            :param cols: grid columns to update
+            :type  cols: slice
+        """
+        self.cells[rows, cols] = 0
+
+    def count(self) -> int:
+        """ Get number of blocked cells. """
+        return int(np.count_nonzero(self.cells))
+
+    def cells_in(self, rect: pygame.Rect) -> List[Tuple[int, int]]:
+        """ List the grid cells that a rect overlaps.
+
+            :param rect: rect in world pixels
+            :type  rect: pygame.Rect
+            :return:     (column, row) cell keys, none outside the grid
+            :rtype:      List[Tuple[int, int]]
+        """
+        rect = rect.clip(self.bounds)
+        if not rect.width or not rect.height:
+            return []
+        return list(grid_cells(rect, self.cell_size))
+
+    def add_box(self, rect: pygame.Rect) -> None:
+        """ Add an obstacle hitbox to the cells it overlaps.
+
+            :param rect: hitbox in world pixels
+            :type  rect: pygame.Rect
+        """
+        for col, row in self.cells_in(rect):
+            idx = self.box_count[row, col]
+            if idx == self.boxes.shape[2]:
+                self.boxes = np.concatenate(
+                    [self.boxes, np.zeros_like(self.boxes)], axis=2
+                )
+            self.boxes[row, col, idx] = tuple(rect)
+            self.box_count[row, col] += 1
+
+    def remove_box(self, rect: pygame.Rect) -> None:
+        """ Remove an obstacle hitbox from the cells it overlaps.
+
+            Cells the hitbox is not in are left as they are.
+
+            :param rect: hitbox in world pixels, as added
+            :type  rect: pygame.Rect
+        """
+        for col, row in self.cells_in(rect):
+            last = self.box_count[row, col] - 1
+            cell = self.boxes[row, col]
+            found = np.flatnonzero((cell[:last + 1] == tuple(rect)).all(1))
+            if not len(found):
+                continue
+            cell[found[0]] = cell[last]  # keep the cell's boxes packed
+            cell[last] = 0
+            self.box_count[row, col] = last
+
+    def gather(self, rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """ Get obstacle hitboxes near many rects at once.
+
+            Results are candidates, callers still need to test for overlap.
+
+            :param rects: (x, y, w, h) rows in world pixels
+            :type  rects: np.ndarray
+            :return:      hitboxes near each rect (rects x candidates x 4),
+                          and which of them are real (rects x candidates)
+            :rtype:       Tuple[np.ndarray, np.ndarray]
+        """
+        size = self.cell_size
+        rows, cols = self.cells.shape
+        first = rects[:, :2] // size  # (col, row) of top-left cells
+        last = np.maximum(rects[:, :2] + rects[:, 2:] - 1, rects[:, :2]) \
+            // size
+        span = (last - first).max(axis=0) + 1  # cells to cover any rect
+        col_offset, row_offset = np.divmod(np.arange(span[0] * span[1]),
+                                           span[0])[::-1]
+        col = first[:, 0, None] + col_offset  # rects x cells
+        row = first[:, 1, None] + row_offset
+        inside = (col <= last[:, 0, None]) & (row <= last[:, 1, None]) & \
+            (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+        col = np.minimum(np.maximum(col, 0), cols - 1)
+        row = np.minimum(np.maximum(row, 0), rows - 1)
+
+        cell_boxes = np.empty(col.shape + (4,), dtype=np.int32)
+        cell_boxes[..., 0] = col * size + self.cell_box.x
+        cell_boxes[..., 1] = row * size + self.cell_box.y
+        cell_boxes[..., 2:] = self.cell_box.size
+        table_boxes = self.boxes[row, col]  # rects x cells x boxes x 4
+        boxes = [cell_boxes, table_boxes.reshape(len(rects), -1, 4)]
+        valid = [
+            inside & (self.cells[row, col] != 0),
+            (inside[:, :, None] & (table_boxes[..., 2] > 0)).reshape(
+                len(rects), -1
+            )
+        ]
+        return np.concatenate(boxes, axis=1), np.concatenate(valid, axis=1)
+
+    def query(self, rect: pygame.Rect) -> List[pygame.Rect]:
+        """ Get obstacle hitboxes in the grid cells that a rect overlaps.
+
+            Results are candidates, callers still need to test for overlap.
+
+            :param rect: rect in world pixels
+            :type  rect: pygame.Rect
+            :return:     hitboxes in world pixels, cell by cell in row-major
+                         order, blocked cell first
+            :rtype:      List[pygame.Rect]
+        """
+        size = self.cell_size
+        rows, cols = self.cells.shape
+        first_col, first_row = max(rect.left // size, 0), \
+            max(rect.top // size, 0)
+        last_col = min(max(rect.right - 1, rect.left) // size, cols - 1)
+        last_row = min(max(rect.bottom - 1, rect.top) // size, rows - 1)
+        lookup, found = self.lookup, []
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                if lookup[row, col]:
+                    found.append(self.cell_box.move(col * size, row * size))
+                found += [
+                    pygame.Rect(box) for box in
+                    self.boxes[row, col, :self.box_count[row, col]].tolist()
+                ]
+        return found
+
+
+class ObstacleGroup(pygame.sprite.Group):
+    """ Group whose sprites' hitboxes entities collide with.
+
+        The collision grid is the only index of obstacles: sprites have
+        their hitbox added to it when they join the group and removed when
+        they leave it (ex: kill). Sprites that move must call move()
+        afterwards.
+    """
+    def __init__(self, grid: CollisionGrid) -> None:
+        """ Constructor.
+
+            :param grid: collision grid to copy sprite hitboxes into
+            :type  grid: CollisionGrid
+        """
+        self.grid = grid
+        self.boxes = {}  # sprite -> hitbox it is in the grid under
+        super().__init__()
+
+    def add_internal(self, sprite, layer=None) -> None:
+        """ Add sprite to the group and its hitbox to the collision grid. """
+        super().add_internal(sprite, layer)
+        self.boxes[sprite] = sprite.hitbox.copy()
+        self.grid.add_box(sprite.hitbox)
+
+    def remove_internal(self, sprite) -> None:
+        """ Remove sprite from the group and its hitbox from the grid. """
+        super().remove_internal(sprite)
+        self.grid.remove_box(self.boxes.pop(sprite))
+
+    def move(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Move a sprite's hitbox in the collision grid after it changed.
+
+            :param sprite: sprite in this group that moved
+            :type  sprite: pygame.sprite.Sprite
+        """
+        if sprite.hitbox != self.boxes[sprite]:
+            self.grid.remove_box(self.boxes[sprite])
+            self.boxes[sprite] = sprite.hitbox.copy()
+            self.grid.add_box(sprite.hitbox)
@@ -0,0 +1,158 @@
+"""
+This module implements game input and frame timing that can be recorded to
+a file and replayed deterministically.
+"""
+from typing import Iterable, Optional
+import struct
+import pygame
+
+
+# pylint: disable=no-member
+INPUT_KEYS = (  # keys the game reads, a recording stores one bit per key
+    pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT,
+    pygame.K_LSHIFT, pygame.K_LCTRL, pygame.K_q
+)
+# pylint: enable=no-member
+RECORDING_MAGIC = b'RPGINPUT'
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct('<8sHHIH')  # magic, version, rate, seed, keys
+RECORDING_FRAME = struct.Struct('<HH')  # frame milliseconds, key bits
+
+
+class KeyState:
+    """ Which of INPUT_KEYS are held, indexable like pygame's key state. """
+    __slots__ = ('bits',)
+
+    def __init__(self, bits: int = 0) -> None:
+        """ Constructor.
+
+            :param bits: bit i set if INPUT_KEYS[i] is held
+            :type  bits: int, optional
+        """
+        self.bits = bits
+
+    @classmethod
+    def of(cls, keys: Iterable[int]) -> 'KeyState':
+        """ Create a key state with some keys held (ex: for scripts).
+
+            :param keys: pygame key codes that are held
+            :type  keys: Iterable[int]
+            :return:     key state
+            :rtype:      KeyState
+        """
+        keys = set(keys)
+        return cls(sum(1 << idx for idx, key in enumerate(INPUT_KEYS)
+                       if key in keys))
+
+    def __getitem__(self, key: int) -> bool:
+        return key in INPUT_KEYS and \
+            bool(self.bits >> INPUT_KEYS.index(key) & 1)
+
+
+class Controls:
+    """ Key state and frame time the game runs on, once per frame.
+
+        Live, they come from the keyboard and the frame clock. While
+        recording, every frame's values also go to a file, 4 bytes each.
+        While replaying, they come from such a file instead, so a session
+        plays out the same way again (with or without a window, as fast as
+        the machine allows), ex: to compare frame times across builds.
+    """
+    def __init__(self) -> None:
+        """ Constructor. """
+        self.keys = KeyState()  # held keys for the current frame
+        self.recording = None  # file being recorded to
+        self.replaying = None  # file being replayed from
+        self.finished = False  # whether the replay ran out of frames
+
+    def record(self, path: str, sim_rate: int, seed: int) -> None:
+        """ Start writing every frame's input to a file.
+
+            :param path:     recording file to write
+            :type  path:     str
+            :param sim_rate: simulation steps per second of the game
+            :type  sim_rate: int
+            :param seed:     random seed the level gets built with
+            :type  seed:     int
+        """
+        # pylint: disable=consider-using-with
+        self.recording = open(path, 'wb')
+        # pylint: enable=consider-using-with
+        self.recording.write(RECORDING_HEADER.pack(
+            RECORDING_MAGIC, RECORDING_VERSION, sim_rate, seed,
+            len(INPUT_KEYS)
+        ))
+        self.recording.write(struct.pack(f'<{len(INPUT_KEYS)}i', *INPUT_KEYS))
+
+    def replay(self, path: str, sim_rate: int) -> int:
+        """ Start reading every frame's input from a recording.
+
+            :param path:     recording file to read
+            :type  path:     str
+            :param sim_rate: simulation steps per second of the game
+            :type  sim_rate: int
+            :return:         random seed to build the level with
+            :rtype:          int
+        """
+        # pylint: disable=consider-using-with
+        self.replaying = open(path, 'rb')
+        # pylint: enable=consider-using-with
+        magic, version, recorded_rate, seed, n_keys = \
+            RECORDING_HEADER.unpack(
+                self.replaying.read(RECORDING_HEADER.size)
+            )
+        assert magic == RECORDING_MAGIC, f'{path} is not a recording'
+        assert version == RECORDING_VERSION, \
+            f'{path} has unsupported version {version}'
+        assert recorded_rate == sim_rate, \
+            f'{path} was recorded at {recorded_rate} simulation steps/second'
+        keys = struct.unpack(f'<{n_keys}i',
+                             self.replaying.read(4 * n_keys))
+        assert tuple(keys) == INPUT_KEYS, f'{path} was recorded with ' \
+            'different input keys'
+        self.finished = False
+        return seed
+
+    def frame(self, elapsed: int) -> int:
+        """ Sample input for a new frame.
+
+            :param elapsed: milliseconds the frame clock measured
+            :type  elapsed: int
+            :return:        milliseconds to simulate, as recorded if
+                            replaying
+            :rtype:         int
+        """
+        if self.replaying is not None:
+            data = self.replaying.read(RECORDING_FRAME.size)
+            if len(data) < RECORDING_FRAME.size:
+                self.finished = True
+                return 0
+            elapsed, bits = RECORDING_FRAME.unpack(data)
+            self.keys = KeyState(bits)
+            return elapsed
+
+        pressed = pygame.key.get_pressed()
+        self.keys = KeyState.of(key for key in INPUT_KEYS if pressed[key])
+        if self.recording is not None:
+            self.recording.write(RECORDING_FRAME.pack(
+                min(elapsed, 0xFFFF), self.keys.bits
+            ))
+        return elapsed
+
+    def close(self) -> Optional[str]:
+        """ Stop recording or replaying.
+
+            :return: path of the recording written, if any
+            :rtype:  Optional[str]
+        """
+        path = None
+        if self.recording is not None:
+            path = self.recording.name
+            self.recording.close()
+        if self.replaying is not None:
+            self.replaying.close()
+        self.recording, self.replaying = None, None
+        return path
+
+
+CONTROLS = Controls()  # shared by the game loop and everything it controls
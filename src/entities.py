@@ -0,0 +1,344 @@
+"""
+This module implements an entity store that keeps actor state in NumPy
+arrays and updates every actor in one batch.
+"""
+from typing import Dict
+import numpy as np
+import pygame
+from animation import ClipLibrary, FRAME_EPSILON, N_STATES
+from collision import CollisionGrid
+from profiler import PROFILER
+
+
+ENTITY_CAPACITY = 64  # rows to start with, doubles when full
+ENTITY_TIMERS = 2  # cooldown timers per entity
+BATCH_MIN = 16  # fewer moving entities collide one at a time (less overhead)
+_NO_STOP = np.iinfo(np.int32).max, np.iinfo(np.int32).min  # end, start
+
+
+class EntityStore:
+    """ Actors (player, NPCs, enemies) as rows of contiguous arrays.
+
+        Each update has three phases: tick() advances every cooldown timer,
+        then whatever controls the entities (ex: player input) sets their
+        directions, states and timers, then step() moves every entity,
+        colliding hitboxes with a collision grid, and advances the clock
+        that animations play on. Entities share the clips of their clip
+        library and only keep a state id (which clip) and an offset from
+        the clock (where in the clip), so animating them costs nothing
+        until a frame is looked up to draw them. Entities are
+        either drawn from the store by a CameraGroup, or stand behind a
+        sprite that copies their state after each step (ex: Player).
+    """
+    def __init__(self,
+                 capacity: int = ENTITY_CAPACITY,
+                 timers: int = ENTITY_TIMERS) -> None:
+        """ Constructor.
+
+            :param capacity: rows to allocate up front
+            :type  capacity: int, optional
+            :param timers:   cooldown timers per entity
+            :type  timers:   int, optional
+        """
+        self.count = 0  # rows in use, alive or free
+        self.free = []  # rows of removed entities, for reuse
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.drawn = np.zeros(capacity, dtype=bool)  # drawn from the store
+        self.pos = np.zeros((capacity, 2))  # sub-pixel hitbox top-left
+        self.hitbox = np.zeros((capacity, 4), dtype=np.int32)  # x, y, w, h
+        self.old_topleft = np.zeros((capacity, 2), dtype=np.int32)
+        self.direction = np.zeros((capacity, 2))
+        self.speed = np.zeros(capacity)  # pixels per second
+        self.library = np.zeros(capacity, dtype=np.int32)  # library id
+        self.state = np.zeros(capacity, dtype=np.int32)  # clip state id
+        self.anim_offset = np.zeros(capacity)  # animation time - clock
+        # ms since each timer's reset, inf until the first one (so new
+        # entities start with every cooldown over)
+        self.timers = np.full((capacity, timers), np.inf)
+        self.time = 0.0  # seconds stepped, the clock animations play on
+        self.libraries = []  # library id -> clip library
+        self.library_ids = {}  # clip library -> library id
+        # library id * N_STATES + state id -> frames, frames per second
+        self.clip_length = np.zeros(0, dtype=np.int32)
+        self.clip_fps = np.zeros(0)
+
+    def add_library(self, library: ClipLibrary) -> int:
+        """ Register the clips of a character type, once per store.
+
+            :param library: clips that entities can play
+            :type  library: ClipLibrary
+            :return:        library id
+            :rtype:         int
+        """
+        if library not in self.library_ids:
+            self.library_ids[library] = len(self.libraries)
+            self.libraries.append(library)
+            self.clip_length = np.append(self.clip_length, library.length)
+            self.clip_fps = np.append(self.clip_fps, library.fps)
+        return self.library_ids[library]
+
+    def grow(self) -> None:
+        """ Double the number of rows of every array. """
+        for name in ('alive', 'drawn', 'pos', 'hitbox', 'old_topleft',
+                     'direction', 'speed', 'library', 'state', 'anim_offset',
+                     'timers'):
+            array = getattr(self, name)
+            grown = np.zeros((2 * len(array),) + array.shape[1:],
+                             dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self,
+            hitbox: pygame.Rect,
+            speed: float,
+            library: ClipLibrary,
+            state: int,
+            anim_time: float = 0.0,
+            drawn: bool = True) -> int:
+        """ Add an entity.
+
+            :param hitbox:    hitbox in world pixels
+            :type  hitbox:    pygame.Rect
+            :param speed:     movement speed in pixels per second
+            :type  speed:     float
+            :param library:   clips the entity plays
+            :type  library:   ClipLibrary
+            :param state:     state id of the clip to start playing
+            :type  state:     int
+            :param anim_time: seconds into the animation to start at (ex:
+                              to keep a crowd from animating in lockstep)
+            :type  anim_time: float, optional
+            :param drawn:     draw from the store, False if a sprite does
+            :type  drawn:     bool, optional
+            :return:          entity id (row)
+            :rtype:           int
+        """
+        if self.free:
+            eid = self.free.pop()
+        else:
+            if self.count == len(self.alive):
+                self.grow()
+            eid = self.count
+            self.count += 1
+        self.alive[eid], self.drawn[eid] = True, drawn
+        self.speed[eid] = speed
+        self.library[eid] = self.add_library(library)
+        self.state[eid] = state
+        self.anim_offset[eid] = anim_time - self.time
+        self.direction[eid] = 0.0
+        self.timers[eid] = np.inf
+        self.place(eid, hitbox)
+        return eid
+
+    def remove(self, eid: int) -> None:
+        """ Remove an entity, freeing its row.
+
+            :param eid: entity id
+            :type  eid: int
+        """
+        self.alive[eid] = False
+        self.free.append(eid)
+
+    def place(self, eid: int, hitbox: pygame.Rect) -> None:
+        """ Put an entity somewhere without moving it there (no collision).
+
+            :param eid:    entity id
+            :type  eid:    int
+            :param hitbox: new hitbox in world pixels
+            :type  hitbox: pygame.Rect
+        """
+        self.hitbox[eid] = tuple(hitbox)
+        self.pos[eid] = hitbox.topleft
+        self.old_topleft[eid] = hitbox.topleft
+
+    def rect(self, eid: int) -> pygame.Rect:
+        """ Get the hitbox of an entity as a rect.
+
+            :param eid: entity id
+            :type  eid: int
+            :return:    hitbox in world pixels
+            :rtype:     pygame.Rect
+        """
+        return pygame.Rect(self.hitbox[eid].tolist())
+
+    def image(self, eid: int) -> pygame.Surface:
+        """ Get the animation frame an entity currently shows.
+
+            :param eid: entity id
+            :type  eid: int
+            :return:    animation frame, shared so do not draw onto it
+            :rtype:     pygame.Surface
+        """
+        return self.libraries[self.library[eid]].image(
+            self.state[eid], self.time + self.anim_offset[eid]
+        )
+
+    def frame_index(self, rows: np.ndarray) -> np.ndarray:
+        """ Get the animation frame several entities currently show.
+
+            :param rows: entity ids
+            :type  rows: np.ndarray
+            :return:     index into the frames of each entity's clip
+            :rtype:      np.ndarray
+        """
+        clip = self.library[rows] * N_STATES + self.state[rows]
+        return np.mod(
+            ((self.time + self.anim_offset[rows]) * self.clip_fps[clip] +
+             FRAME_EPSILON).astype(np.int64),
+            self.clip_length[clip]
+        )
+
+    def tick(self, dt: float) -> None:
+        """ Advance every cooldown timer.
+
+            :param dt: simulated seconds since the last update
+            :type  dt: float
+        """
+        self.timers[:self.count] += dt * 1000
+
+    def step(self, dt: float, grid: CollisionGrid) -> None:
+        """ Move every entity and advance the animation clock.
+
+            :param dt:   simulated seconds since the last update
+            :type  dt:   float
+            :param grid: obstacles to collide with
+            :type  grid: CollisionGrid
+        """
+        self.time += dt
+        rows = np.flatnonzero(self.alive[:self.count])
+        self.old_topleft[rows] = self.hitbox[rows, :2]
+        direction = self.direction[rows]
+        length = np.sqrt(direction[:, 0] ** 2 + direction[:, 1] ** 2)
+        np.divide(direction, length[:, None], out=direction,
+                  where=length[:, None] != 0)
+        distance = self.speed[rows] * dt
+        # track position in floats so small steps do not get rounded away,
+        # snapping back to the hitbox whenever a collision moves it
+        for axis in (0, 1):
+            self.pos[rows, axis] += distance * direction[:, axis]
+            self.hitbox[rows, axis] = np.round(self.pos[rows, axis])
+            with PROFILER.section('collision'):
+                self.collide(rows, direction[:, axis], axis, grid)
+            snapped = self.hitbox[rows, axis] != \
+                np.round(self.pos[rows, axis])
+            self.pos[rows[snapped], axis] = self.hitbox[rows[snapped], axis]
+        self.direction[rows] = direction
+
+    def collide(self,
+                rows: np.ndarray,
+                direction: np.ndarray,
+                axis: int,
+                grid: CollisionGrid) -> None:
+        """ Push hitboxes out of obstacles they moved into along one axis.
+
+            :param rows:      entity ids that moved
+            :type  rows:      np.ndarray
+            :param direction: their direction along the axis
+            :type  direction: np.ndarray
+            :param axis:      0 for horizontal, 1 for vertical
+            :type  axis:      int
+            :param grid:      obstacles to collide with
+            :type  grid:      CollisionGrid
+        """
+        moving = direction != 0
+        rows, direction = rows[moving], direction[moving]
+        if not len(rows):
+            return
+        if len(rows) < BATCH_MIN:
+            for eid, forward in zip(rows.tolist(), (direction > 0).tolist()):
+                self.collide_one(eid, forward, axis, grid)
+            return
+        hitbox = self.hitbox[rows]
+        boxes, valid = grid.gather(hitbox)
+        overlap = valid & \
+            (boxes[:, :, 0] < hitbox[:, None, 0] + hitbox[:, None, 2]) & \
+            (boxes[:, :, 0] + boxes[:, :, 2] > hitbox[:, None, 0]) & \
+            (boxes[:, :, 1] < hitbox[:, None, 1] + hitbox[:, None, 3]) & \
+            (boxes[:, :, 1] + boxes[:, :, 3] > hitbox[:, None, 1])
+        hit = overlap.any(axis=1)
+        if not hit.any():
+            return
+        forward = direction > 0
+        box_start = boxes[:, :, axis]
+        box_end = box_start + boxes[:, :, axis + 2]
+        # moving forward, the hitbox ends where the nearest obstacle starts
+        stop_end = np.where(overlap, box_start, _NO_STOP[0])
+        stop_start = np.where(overlap, box_end, _NO_STOP[1])
+        new_start = np.where(
+            forward,
+            stop_end.min(axis=1) - hitbox[:, axis + 2],
+            stop_start.max(axis=1)
+        )
+        self.hitbox[rows[hit], axis] = new_start[hit]
+
+    def collide_one(self,
+                    eid: int,
+                    forward: bool,
+                    axis: int,
+                    grid: CollisionGrid) -> None:
+        """ Push one hitbox out of obstacles it moved into along one axis.
+
+            :param eid:     entity id
+            :type  eid:     int
+            :param forward: whether it moved right/down, else left/up
+            :type  forward: bool
+            :param axis:    0 for horizontal, 1 for vertical
+            :type  axis:    int
+            :param grid:    obstacles to collide with
+            :type  grid:    CollisionGrid
+        """
+        hitbox = self.rect(eid)
+        for box in grid.query(hitbox):
+            if box.colliderect(hitbox):
+                if axis == 0 and forward:
+                    hitbox.right = box.left
+                elif axis == 0:
+                    hitbox.left = box.right
+                elif forward:
+                    hitbox.bottom = box.top
+                else:
+                    hitbox.top = box.bottom
+        self.hitbox[eid, axis] = hitbox[axis]
+
+    def drawables(self,
+                  view: pygame.Rect,
+                  alpha: float) -> Dict[tuple, tuple]:
+        """ Get what to draw for the store-drawn entities inside a view.
+
+            :param view:  world-space rect that the screen shows
+            :type  view:  pygame.Rect
+            :param alpha: how far between the previous and latest steps to
+                          draw entities, from 0 to 1
+            :type  alpha: float
+            :return:      (store, entity id) -> (image, screen rect, depth)
+            :rtype:       Dict[tuple, tuple]
+        """
+        count = self.count
+        rows = np.flatnonzero(self.alive[:count] & self.drawn[:count])
+        if not len(rows):
+            return {}
+        hitbox = self.hitbox[rows]
+        topleft = np.round(
+            self.old_topleft[rows] +
+            (hitbox[:, :2] - self.old_topleft[rows]) * alpha
+        ).astype(int)
+        centers = topleft + hitbox[:, 2:] // 2
+        # generous culling, images can be larger than hitboxes
+        margin = 2 * hitbox[:, 2:].max(initial=0)
+        near = (centers[:, 0] > view.left - margin) & \
+            (centers[:, 0] < view.right + margin) & \
+            (centers[:, 1] > view.top - margin) & \
+            (centers[:, 1] < view.bottom + margin)
+        rows = rows[near]
+        found = {}
+        for eid, library, state, frame, (center_x, center_y), depth in zip(
+                rows.tolist(), self.library[rows].tolist(),
+                self.state[rows].tolist(), self.frame_index(rows).tolist(),
+                centers[near].tolist(),
+                (hitbox[near, 1] + hitbox[near, 3] // 2).tolist()):
+            image = self.libraries[library].frames[state][frame]
+            rect = image.get_rect(
+                center=(center_x - view.left, center_y - view.top)
+            )
+            found[self, eid] = (image, rect, depth)
+        return found
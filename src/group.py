@@ -1,45 +1,466 @@
 """
 This module implements custom sprite groups.
 """
+from bisect import bisect_left, insort
+from heapq import merge
+from itertools import count
+from typing import Dict, Iterator, List, Optional, Tuple
 import pygame
+from assets import ASSETS
+from memory import MEMORY
+from render import DISPLAY
+from tile import TILE_SIZE
 
 
-class CameraGroup(pygame.sprite.Group):
-    """ Group to center game view on player sprite. """
-    def __init__(self) -> None:
-        """ Constructor. """
+CAMERA_CELL_SIZE = 4 * TILE_SIZE  # coarser than tiles to keep queries short
+CHUNK_SIZE = 8 * TILE_SIZE  # side of a baked floor chunk in pixels
+FLOOR_IMAGE = '../graphics/tilemap/ground.png'
+FLOOR_ORIGIN = 'CameraGroup floor'  # origin of floor chunks (see memory)
+
+
+def grid_cells(rect: pygame.Rect,
+               cell_size: int) -> Iterator[Tuple[int, int]]:
+    """ Iterate over the cells of a uniform grid that a rect overlaps.
+
+        :param rect:      rect in world pixels
+        :type  rect:      pygame.Rect
+        :param cell_size: width and height of a grid cell in pixels
+        :type  cell_size: int
+        :return:          (column, row) cell keys
+        :rtype:           Iterator[Tuple[int, int]]
+    """
+    first_col, first_row = rect.left // cell_size, rect.top // cell_size
+    last_col = max(rect.right - 1, rect.left) // cell_size
+    last_row = max(rect.bottom - 1, rect.top) // cell_size
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            yield col, row
+
+
+def merge_rects(rects: List[pygame.Rect],
+                bounds: pygame.Rect) -> List[pygame.Rect]:
+    """ Clip rects to bounds and merge the ones that overlap.
+
+        :param rects:  rects to merge
+        :type  rects:  List[pygame.Rect]
+        :param bounds: rect to clip to (ex: the screen)
+        :type  bounds: pygame.Rect
+        :return:       non-overlapping, non-empty rects
+        :rtype:        List[pygame.Rect]
+    """
+    merged = []
+    for rect in rects:
+        rect = rect.clip(bounds)
+        if not rect.width or not rect.height:
+            continue
+        idx = rect.collidelist(merged)
+        while idx != -1:  # grow until it overlaps nothing left
+            rect.union_ip(merged.pop(idx))
+            idx = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
+def lerp_topleft(sprite: pygame.sprite.Sprite,
+                 alpha: float) -> Tuple[int, int]:
+    """ Get where to draw a sprite between its last two simulation states.
+
+        :param sprite: sprite, interpolated if it has an old_rect attribute
+        :type  sprite: pygame.sprite.Sprite
+        :param alpha:  fraction of the way from old_rect to rect
+        :type  alpha:  float
+        :return:       top-left corner in world pixels
+        :rtype:        Tuple[int, int]
+    """
+    old_rect = getattr(sprite, 'old_rect', None)
+    if old_rect is None:
+        return sprite.rect.topleft
+    return (
+        round(old_rect.left + (sprite.rect.left - old_rect.left) * alpha),
+        round(old_rect.top + (sprite.rect.top - old_rect.top) * alpha)
+    )
+
+
+class SpatialGroup(pygame.sprite.Group):
+    """ Group that buckets sprites into a uniform grid for fast rect queries.
+
+        Sprites are indexed when they join the group and dropped when they
+        leave it (ex: kill), so static tiles get indexed once when the level
+        map is built. Sprites that move must call move() afterwards.
+    """
+    def __init__(self, cell_size: int, rect_attr: str = 'hitbox') -> None:
+        """ Constructor.
+
+            :param cell_size: width and height of a grid cell in pixels
+            :type  cell_size: int
+            :param rect_attr: sprite attribute holding the rect to index
+            :type  rect_attr: str
+        """
+        self.cell_size = cell_size
+        self.rect_attr = rect_attr
+        self.cells = {}         # (col, row) -> sprites in cell (ordered)
+        self.sprite_cells = {}  # sprite -> (col, row) cells it is in
         super().__init__()
-        self.display_surface = pygame.display.get_surface()
-        half_width, half_height = self.display_surface.get_size()
-        half_width, half_height = half_width // 2, half_height // 2
-        # pylint: disable=c-extension-no-member
-        self.offset = pygame.math.Vector2()
-        self.offset.x = half_width
-        self.offset.y = half_height
-        # pylint: enable=c-extension-no-member
-
-        self.floor = \
-            pygame.image.load('../graphics/tilemap/ground.png').convert()
-        self.floor_rect = self.floor.get_rect(topleft=(0, 0))
-
-    def custom_draw(self, player: pygame.sprite.Sprite) -> None:
-        """ Draw all group sprites relative to the player position.
+
+    def cells_in(self, rect: pygame.Rect) -> Iterator[Tuple[int, int]]:
+        """ Iterate over the grid cells that a rect overlaps.
+
+            :param rect: rect in world pixels
+            :type  rect: pygame.Rect
+            :return:     (column, row) cell keys
+            :rtype:      Iterator[Tuple[int, int]]
+        """
+        return grid_cells(rect, self.cell_size)
+
+    def index(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Put a sprite into the grid cells its rect overlaps. """
+        keys = list(self.cells_in(getattr(sprite, self.rect_attr)))
+        for key in keys:
+            self.cells.setdefault(key, {})[sprite] = None
+        self.sprite_cells[sprite] = keys
+
+    def unindex(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Take a sprite out of every grid cell it is in. """
+        for key in self.sprite_cells.pop(sprite):
+            bucket = self.cells[key]
+            del bucket[sprite]
+            if not bucket:
+                del self.cells[key]
+
+    def add_internal(self, sprite, layer=None) -> None:
+        """ Add sprite to the group and index it by its rect. """
+        super().add_internal(sprite, layer)
+        self.index(sprite)
+
+    def remove_internal(self, sprite) -> None:
+        """ Remove sprite from the group and from the index. """
+        super().remove_internal(sprite)
+        self.unindex(sprite)
+
+    def move(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Re-index a sprite after its rect changed.
+
+            :param sprite: sprite in this group that moved
+            :type  sprite: pygame.sprite.Sprite
+        """
+        keys = list(self.cells_in(getattr(sprite, self.rect_attr)))
+        if keys != self.sprite_cells[sprite]:
+            self.unindex(sprite)
+            self.index(sprite)
+
+    def query(self, rect: pygame.Rect) -> List[pygame.sprite.Sprite]:
+        """ Get sprites in the grid cells a rect overlaps.
+
+            Results are candidates, callers still need to test for overlap.
+
+            :param rect: rect in world pixels
+            :type  rect: pygame.Rect
+            :return:     sprites near the rect, each listed once
+            :rtype:      List[pygame.sprite.Sprite]
+        """
+        found = {}
+        for key in self.cells_in(rect):
+            bucket = self.cells.get(key)
+            if bucket:
+                found.update(bucket)
+        return list(found)
+
+
+class CameraGroup(SpatialGroup):
+    """ Group to center game view on player sprite.
+
+        Static sprites are indexed by rect in a grid whose cells each keep
+        their sprites in depth order, so drawing only merges the cells that
+        are on screen. Sprites with a true "dynamic" attribute (ex: player)
+        are kept aside and depth-sorted each frame instead, and skipped
+        while their "visible" attribute is false (ex: pooled sprites), along
+        with the entities of entity stores in "stores".
+    """
+    def __init__(self, floor: bool = True) -> None:
+        """ Constructor.
+
+            :param floor: load the whole floor image, False when the floor
+                          gets loaded piece by piece (see load_floor)
+            :type  floor: bool, optional
+        """
+        self.moving = {}  # dynamic sprites, ordered set
+        self.stores = []  # entity stores to draw entities from
+        self.entry_count = count()  # tie-breaker for equal depths
+        super().__init__(CAMERA_CELL_SIZE, rect_attr='rect')
+        self.renderer = DISPLAY.world()  # draws the screen, maybe scaled
+        half_width, half_height = self.renderer.get_rect().size
+        self.half_size = half_width // 2, half_height // 2
+
+        self.floor = ASSETS.image(FLOOR_IMAGE, alpha=False) if floor else None
+        self.floor_rect = \
+            self.floor.get_rect() if floor else pygame.Rect(0, 0, 0, 0)
+        self.chunks = {}  # (col, row) -> floor chunk, drawn if no floor
+
+        # what the last custom_draw showed, to find areas that changed
+        self.view_topleft = None
+        self.drawn_scale = None  # render scale of the last draw
+        self.drawn = {}  # dynamic sprite -> (image, screen rect, depth)
+        self.moved = []  # world rects of static sprites that moved since
+
+    def bake(self,
+             images: List[Tuple[pygame.Surface, pygame.Rect]]) -> None:
+        """ Composite the floor and static images into floor chunks.
+
+            Baked images are drawn under every sprite, so only pass images
+            that never need depth sorting against moving sprites.
+
+            :param images: images and where they go in world pixels
+            :type  images: List[Tuple[pygame.Surface, pygame.Rect]]
+        """
+        for key in grid_cells(self.floor_rect, CHUNK_SIZE):
+            area = pygame.Rect(
+                key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE,
+                CHUNK_SIZE, CHUNK_SIZE
+            ).clip(self.floor_rect)
+            self.chunks[key] = MEMORY.track(
+                self.floor.subsurface(area).copy(), FLOOR_ORIGIN
+            )
+        for image, rect in images:
+            for key in grid_cells(rect, CHUNK_SIZE):
+                if key not in self.chunks:  # beyond the floor image
+                    self.chunks[key] = self.new_chunk()
+                self.chunks[key].blit(
+                    image,
+                    (rect.left - key[0] * CHUNK_SIZE,
+                     rect.top - key[1] * CHUNK_SIZE)
+                )
+        self.floor = None  # chunks hold every floor pixel now
+        ASSETS.release(FLOOR_IMAGE, alpha=False)
+
+    def new_chunk(self) -> pygame.Surface:
+        """ Create a blank floor chunk, for areas beyond the floor image.
+
+            :return: black chunk
+            :rtype:  pygame.Surface
+        """
+        return MEMORY.track(self.renderer.prepare(
+            pygame.Surface((CHUNK_SIZE, CHUNK_SIZE)), alpha=False
+        ), FLOOR_ORIGIN)
+
+    def load_floor(self,
+                   area: pygame.Rect,
+                   floor: Optional[pygame.Surface],
+                   images: List[Tuple[pygame.Surface, pygame.Rect]]) -> None:
+        """ Set the floor chunks of one area, baking static images into them.
+
+            :param area:   world-space rect, aligned to CHUNK_SIZE
+            :type  area:   pygame.Rect
+            :param floor:  floor image of the area, None for no floor
+            :type  floor:  Optional[pygame.Surface]
+            :param images: images and where they go, inside the area
+            :type  images: List[Tuple[pygame.Surface, pygame.Rect]]
+        """
+        for key in grid_cells(area, CHUNK_SIZE):
+            rect = pygame.Rect(key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE,
+                               CHUNK_SIZE, CHUNK_SIZE)
+            if floor is not None:
+                part = rect.move(-area.left, -area.top).clip(floor.get_rect())
+                if part.width and part.height:
+                    # shares the area's pixels unless something gets baked
+                    self.chunks[key] = MEMORY.track(floor.subsurface(part),
+                                                    FLOOR_ORIGIN)
+            if any(rect.colliderect(image_rect) for _, image_rect in images):
+                self.chunks[key] = MEMORY.track(
+                    self.chunks[key].copy(), FLOOR_ORIGIN
+                ) if key in self.chunks else self.new_chunk()
+        for image, rect in images:
+            for key in grid_cells(rect, CHUNK_SIZE):
+                self.chunks[key].blit(
+                    image,
+                    (rect.left - key[0] * CHUNK_SIZE,
+                     rect.top - key[1] * CHUNK_SIZE)
+                )
+        self.moved.append(area.copy())  # for dirty-rect redraws
+
+    def drop_floor(self, area: pygame.Rect) -> None:
+        """ Forget the floor chunks of one area.
+
+            :param area: world-space rect, aligned to CHUNK_SIZE
+            :type  area: pygame.Rect
+        """
+        for key in grid_cells(area, CHUNK_SIZE):
+            self.chunks.pop(key, None)
+        self.moved.append(area.copy())
+
+    def draw_floor(self, view: pygame.Rect, area: pygame.Rect) -> None:
+        """ Draw the part of the floor (or baked chunks) inside a view.
+
+            :param view: world-space rect that the screen shows
+            :type  view: pygame.Rect
+            :param area: world-space rect to cover, inside the view
+            :type  area: pygame.Rect
+        """
+        if self.floor is not None:
+            self.renderer.blits([(
+                self.floor,
+                (self.floor_rect.left - view.left,
+                 self.floor_rect.top - view.top)
+            )])
+            return
+        self.renderer.blits([
+            (self.chunks[key],
+             (key[0] * CHUNK_SIZE - view.left,
+              key[1] * CHUNK_SIZE - view.top))
+            for key in grid_cells(area, CHUNK_SIZE) if key in self.chunks
+        ])
+
+    def index(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Insert a sprite into the depth-ordered cells it overlaps. """
+        if getattr(sprite, 'dynamic', False):
+            self.moving[sprite] = None
+            return
+        entry = (sprite.rect.centery, next(self.entry_count), sprite)
+        keys = list(self.cells_in(sprite.rect))
+        for key in keys:
+            insort(self.cells.setdefault(key, []), entry)
+        self.sprite_cells[sprite] = (keys, entry, sprite.rect.copy())
+
+    def unindex(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Take a sprite out of the depth-ordered cells it is in. """
+        if sprite in self.moving:
+            del self.moving[sprite]
+            return
+        keys, entry, _ = self.sprite_cells.pop(sprite)
+        for key in keys:
+            bucket = self.cells[key]
+            del bucket[bisect_left(bucket, entry)]
+            if not bucket:
+                del self.cells[key]
+
+    def move(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Re-insert a static sprite after its rect changed.
+
+            :param sprite: sprite in this group that moved
+            :type  sprite: pygame.sprite.Sprite
+        """
+        if sprite not in self.moving:
+            self.moved.append(self.sprite_cells[sprite][2])  # old rect
+            self.unindex(sprite)
+            self.index(sprite)
+            self.moved.append(sprite.rect.copy())
+
+    def query(self, rect: pygame.Rect) -> List[pygame.sprite.Sprite]:
+        """ Get static sprites in the grid cells a rect overlaps.
+
+            :param rect: rect in world pixels
+            :type  rect: pygame.Rect
+            :return:     sprites near the rect, in depth order
+            :rtype:      List[pygame.sprite.Sprite]
+        """
+        buckets = [
+            self.cells[key] for key in self.cells_in(rect) if key in self.cells
+        ]
+        found, last = [], None
+        for entry in merge(*buckets):
+            if entry is not last:  # sprites can span several cells
+                found.append(entry[2])
+                last = entry
+        return found
+
+    def draw_area(self,
+                  view: pygame.Rect,
+                  area: pygame.Rect,
+                  moving: Dict[pygame.sprite.Sprite, tuple]) -> None:
+        """ Redraw floor and sprites inside one area of the screen.
+
+            :param view:   world-space rect that the screen shows
+            :type  view:   pygame.Rect
+            :param area:   screen-space rect to redraw
+            :type  area:   pygame.Rect
+            :param moving: on-screen dynamic sprites and entities ->
+                           (image, screen rect, depth)
+            :type  moving: Dict[object, tuple]
+        """
+        world = area.move(view.topleft)
+        self.renderer.set_clip(area)
+        self.renderer.fill('black', area)
+        self.draw_floor(view, world)
+
+        in_area = [entry for entry in moving.values()
+                   if entry[1].colliderect(area)]
+        in_area.sort(key=lambda entry: entry[2])
+        static = [
+            (sprite.image,
+             (sprite.rect.left - view.left, sprite.rect.top - view.top),
+             sprite.rect.centery)
+            for sprite in self.query(world) if sprite.rect.colliderect(world)
+        ]
+        self.renderer.blits(
+            [entry[:2] for entry in merge(in_area, static,
+                                          key=lambda entry: entry[2])]
+        )
+        self.renderer.set_clip(None)
+
+    def custom_draw(self,
+                    player: pygame.sprite.Sprite,
+                    alpha: float = 1.0,
+                    dirty: Optional[List[pygame.Rect]] = None
+                    ) -> List[pygame.Rect]:
+        """ Draw on-screen group sprites relative to the player position.
+
+            By default the whole screen is redrawn. Given dirty areas, only
+            those plus the old and new spots of anything that changed since
+            the last call are redrawn, unless the camera scrolled, the render
+            scale changed or the renderer does not keep the screen between
+            frames (ex: while scaled).
 
             :param player: player sprite
             :type  player: pygame.sprite.Sprite
+            :param alpha:  how far between the previous and latest simulation
+                           states to draw moving sprites, from 0 to 1
+            :type  alpha:  float, optional
+            :param dirty:  extra screen areas to redraw (ex: HUD changes),
+                           None to redraw the whole screen
+            :type  dirty:  List[pygame.Rect], optional
+            :return:       screen areas that were redrawn
+            :rtype:        List[pygame.Rect]
         """
-        offset_from_player = [
-            a - b
-            for a, b in zip(self.floor_rect.topleft, player.rect.topleft)
-        ]
-        pos_on_screen = offset_from_player + self.offset
-        self.display_surface.blit(self.floor, pos_on_screen)
-
-        sorted_sprites = sorted(self.sprites(), key=lambda s: s.rect.centery)
-        for sprite in sorted_sprites:  # inherited
-            offset_from_player = [
-                a - b
-                for a, b in zip(sprite.rect.topleft, player.rect.topleft)
-            ]
-            pos_on_screen = offset_from_player + self.offset
-            self.display_surface.blit(sprite.image, pos_on_screen)
+        # world-space rect that the screen currently shows
+        player_left, player_top = lerp_topleft(player, alpha)
+        view = self.renderer.get_rect()
+        view.topleft = (player_left - self.half_size[0],
+                        player_top - self.half_size[1])
+
+        moving = {}  # on-screen dynamic sprite -> (image, screen rect, depth)
+        for sprite in self.moving:
+            if getattr(sprite, 'visible', True) and \
+                    sprite.rect.colliderect(view):
+                left, top = lerp_topleft(sprite, alpha)
+                moving[sprite] = (
+                    sprite.image,
+                    sprite.image.get_rect(
+                        topleft=(left - view.left, top - view.top)
+                    ),
+                    sprite.rect.centery
+                )
+        for store in self.stores:
+            moving.update(store.drawables(view, alpha))
+        drawn, self.drawn = self.drawn, moving
+        scrolled, self.view_topleft = \
+            view.topleft != self.view_topleft, view.topleft
+        moved, self.moved = self.moved, []
+        rescaled, self.drawn_scale = \
+            self.renderer.scale != self.drawn_scale, self.renderer.scale
+
+        if dirty is None or scrolled or rescaled or \
+                not self.renderer.retained:
+            areas = [self.renderer.get_rect()]
+        else:
+            areas = list(dirty)
+            areas += [rect.move(-view.left, -view.top) for rect in moved]
+            for sprite in drawn.keys() | moving.keys():
+                if drawn.get(sprite) != moving.get(sprite):
+                    areas += [
+                        entry[1] for entry in (drawn.get(sprite),
+                                               moving.get(sprite)) if entry
+                    ]
+            areas = merge_rects(areas, self.renderer.get_rect())
+        for area in areas:
+            self.draw_area(view, area, moving)
+        self.renderer.flush()
+        return areas
@@ -2,80 +2,328 @@
 """
 This module implements levels for the <title TBD> RPG game.
 """
-from random import choice
+from random import Random
+from typing import Dict, List, Tuple
+import random
+import numpy as np
 import pygame
-from group import CameraGroup
-from player import Player
-from tile import Tile
+from assets import ASSETS
+from collision import CollisionGrid, ObstacleGroup
+from entities import EntityStore
+from group import CameraGroup, FLOOR_IMAGE
+from navigation import NavigationGrid, walkable_cells
+from player import Player, Weapon, weapon_graphic
+from player import PLAYER_CLIP_DIRS, WEAPON_DATA, WEAPON_PLACEMENT
+from pool import SpritePool
+from profiler import PROFILER
+from tile import Tile, footprint
 from ui import UserInterface
 from utils import load_map_layer, load_graphics
+from world import RegionStreamer, REGION_SIZE
+from world import region_floor, region_floor_path, region_rect
 
 
 TILE_SIZE = 64
+LAYER_FILES = {
+    'boundary': '../map/map_FloorBlocks.csv',
+    'grass': '../map/map_Grass.csv',
+    'object': '../map/map_Objects.csv'
+}
+GRASS_GRAPHICS = '../graphics/grass'
+OBJECT_GRAPHICS = '../graphics/objects'
 
 
 class Level:
     """ Level for RPG game. """
-    def __init__(self) -> None:
-        """ Constructor. """
+    def __init__(self,
+                 bake_static: bool = False,
+                 stream: bool = False,
+                 map_repeats: int = 1) -> None:
+        """ Constructor.
+
+        :param bake_static: composite flat visible tiles into floor chunks
+        :type  bake_static: bool, optional
+        :param stream:      only keep map regions near the player loaded,
+                            instead of building the whole map up front
+        :type  stream:      bool, optional
+        :param map_repeats: copies of the map along each axis (ex: to
+                            benchmark larger maps)
+        :type  map_repeats: int, optional
+        """
+        self.bake_static = bake_static
         self.display_surface = pygame.display.get_surface()
-        self.visible_sprites = CameraGroup()           # can see on screen
-        self.obstacle_sprites = pygame.sprite.Group()  # impede player movement
+        self.layers = self.load_layers(map_repeats)
+        self.map_size = tuple(  # rows, columns of tiles
+            max(shape) for shape in
+            zip(*[layer['layout'].shape for layer in self.layers.values()])
+        )
+        self.visible_sprites = CameraGroup(floor=not stream)  # on screen
+        self.collision_grid = CollisionGrid(self.map_size)
+        self.obstacle_sprites = ObstacleGroup(self.collision_grid)  # impede
+        # from the layers, so it covers the whole map even when streaming
+        self.navigation = NavigationGrid(
+            self.map_size,
+            lambda: walkable_cells(self.map_size, self.obstacle_footprints())
+        )
+        self.entities = EntityStore()  # actors (ex: player), moved together
+        self.visible_sprites.stores.append(self.entities)
+        self.weapon_pool = SpritePool(lambda: Weapon([self.visible_sprites]))
         self.player = Player(
             (2000, 1430),
             [self.visible_sprites],
-            self.obstacle_sprites
+            self.entities,
+            self.weapon_pool
         )
         self.user_interface = UserInterface()
-        self.create_map()
+        self.streamer = None
+        with PROFILER.section('create_map'):
+            if stream:
+                self.streamer = RegionStreamer(
+                    pygame.Rect(0, 0, self.map_size[1] * TILE_SIZE,
+                                self.map_size[0] * TILE_SIZE),
+                    self.load_region,
+                    self.unload_region
+                )
+                self.streamer.update(self.player.hitbox.center, float('inf'))
+            else:
+                self.create_map()
 
     @staticmethod
-    def load_layers() -> None:
-        """ Loads and organizes level map assets. """
+    def manifest(stream: bool = False) -> Dict[str, list]:
+        """ List the files a level loads, so they can be preloaded.
+
+        :param stream: whether the level streams its map (and floor)
+        :type  stream: bool, optional
+        :return:       map layer paths, image directory paths and
+                       (image path, keeps alpha) pairs
+        :rtype:        Dict[str, list]
+        """
         return {
+            'map_layers': list(LAYER_FILES.values()),
+            'image_dirs': [GRASS_GRAPHICS, OBJECT_GRAPHICS] +
+                          PLAYER_CLIP_DIRS,
+            'images': ([] if stream else [(FLOOR_IMAGE, False)]) + [
+                (weapon['graphic'], True) for weapon in WEAPON_DATA
+            ] + [
+                (weapon_graphic(weapon_idx, facing), True)
+                for weapon_idx in range(len(WEAPON_DATA))
+                for facing in WEAPON_PLACEMENT
+            ]
+        }
+
+    @staticmethod
+    def load_layers(repeats: int = 1) -> dict:
+        """ Loads and organizes level map assets.
+
+        :param repeats: copies of the map along each axis
+        :type  repeats: int, optional
+        :return:        layer name -> layout, graphics, how map values pick
+                        graphics, and sprite groups
+        :rtype:         dict
+        """
+        layers = {
             'boundary': {
-                'layout': load_map_layer('../map/map_FloorBlocks.csv'),
+                'layout': load_map_layer(LAYER_FILES['boundary']),
                 'graphics': None,
-                'val_to_graphic': lambda val, graphics: None,
+                'val_to_graphic': lambda val, graphics, rng: None,
                 'groups': ('obstacle',)
             },
             'grass': {
-                'layout': load_map_layer('../map/map_Grass.csv'),
-                'graphics': load_graphics('../graphics/grass'),
-                'val_to_graphic': lambda val, graphics: choice(graphics),
+                'layout': load_map_layer(LAYER_FILES['grass']),
+                'graphics': load_graphics(GRASS_GRAPHICS),
+                'val_to_graphic':
+                    lambda val, graphics, rng: rng.choice(graphics),
                 'groups': ('visible', 'obstacle')
             },
             'object': {
-                'layout': load_map_layer('../map/map_Objects.csv'),
-                'graphics': load_graphics('../graphics/objects'),
-                'val_to_graphic': lambda val, graphics: graphics[val],
+                'layout': load_map_layer(LAYER_FILES['object']),
+                'graphics': load_graphics(OBJECT_GRAPHICS),
+                'val_to_graphic': lambda val, graphics, rng: graphics[val],
                 'groups': ('visible', 'obstacle')
             }
         }
+        if repeats > 1:
+            for layer in layers.values():
+                layer['layout'] = np.tile(layer['layout'], (repeats, repeats))
+        return layers
+
+    def obstacle_footprints(self) -> List[tuple]:
+        """ List where the map layers put obstacles, by hitbox footprint.
+
+        :return: (True at the obstacles' map cells, footprint) pairs (see
+                 navigation.walkable_cells)
+        :rtype:  List[tuple]
+        """
+        footprints = []
+        for layer_name, layer in self.layers.items():
+            layout = layer['layout']
+            if layer_name != 'object':  # one tile per cell
+                footprints.append((
+                    layout != -1,
+                    footprint(layer_name, (TILE_SIZE, TILE_SIZE))
+                ))
+                continue
+            for val in np.unique(layout[layout != -1]).tolist():
+                graphic = layer['val_to_graphic'](val, layer['graphics'],
+                                                  None)
+                footprints.append((
+                    layout == val,
+                    footprint(layer_name, graphic.get_size())
+                ))
+        return footprints
 
     def create_map(self) -> None:
         """ Assign tiles to locations and sprite groups based on map nums. """
+        _, baked = self.create_tiles(
+            slice(0, self.map_size[0]), slice(0, self.map_size[1]), random
+        )
+        if self.bake_static:
+            self.visible_sprites.bake(baked)
+
+    def create_tiles(self,
+                     rows: slice,
+                     cols: slice,
+                     rng: Random,
+                     bake_area: pygame.Rect = None
+                     ) -> Tuple[List[Tile], List[tuple]]:
+        """ Create the tiles of part of the map.
+
+        :param rows:      map rows to create tiles for
+        :type  rows:      slice
+        :param cols:      map columns to create tiles for
+        :type  cols:      slice
+        :param rng:       random source for picking tile variants
+        :type  rng:       Random
+        :param bake_area: world-space rect that flat tiles must lie inside
+                          to be baked, None for anywhere
+        :type  bake_area: pygame.Rect, optional
+        :return:          created tiles, (image, rect) of tiles to bake
+        :rtype:           Tuple[List[Tile], List[tuple]]
+        """
         str_to_group = {
             'visible': self.visible_sprites,
             'obstacle': self.obstacle_sprites
         }
 
+        tiles = []
+        baked = []  # (image, rect) to composite into floor chunks
+
         # define each tile in a level map layer in terms of its:
         # location, group membership, layer membership, graphic
-        for layer_name, layer in self.load_layers().items():
-            for row_idx, row in enumerate(layer['layout']):
-                for col_idx, val in enumerate(row):
-                    x_pixel, y_pixel = TILE_SIZE * col_idx, TILE_SIZE * row_idx
-                    if val != -1:  # not whitespace
-                        Tile(
-                            (x_pixel, y_pixel),
-                            [str_to_group[s] for s in layer['groups']],
-                            layer_name,
-                            layer['val_to_graphic'](val, layer['graphics'])
-                        )
-
-    def run(self) -> None:
-        """ Load level into game. """
-        self.visible_sprites.custom_draw(self.player)
-        self.visible_sprites.update()
-        self.user_interface.display(self.player)
+        for layer_name, layer in self.layers.items():
+            layout = layer['layout'][rows, cols]
+            if 'visible' not in layer['groups']:
+                # invisible obstacles need no sprites, only blocked cells
+                self.collision_grid.block(
+                    slice(rows.start, rows.start + layout.shape[0]),
+                    slice(cols.start, cols.start + layout.shape[1]),
+                    layout != -1
+                )
+                continue
+            row_idxs, col_idxs = np.nonzero(layout != -1)  # skip whitespace
+            vals = layout[row_idxs, col_idxs].tolist()
+            for row_idx, col_idx, val in zip((row_idxs + rows.start).tolist(),
+                                             (col_idxs + cols.start).tolist(),
+                                             vals):
+                x_pixel, y_pixel = TILE_SIZE * col_idx, TILE_SIZE * row_idx
+                graphic = layer['val_to_graphic'](val, layer['graphics'], rng)
+                groups = layer['groups']
+                # flat tiles never overlap the player out of depth order,
+                # so they can live in the floor instead
+                bake = self.bake_static and 'visible' in groups \
+                    and graphic.get_height() <= TILE_SIZE
+                if bake and bake_area is not None:
+                    rect = graphic.get_rect(topleft=(x_pixel, y_pixel))
+                    if layer_name == 'object':  # see Tile
+                        rect.move_ip(0, -TILE_SIZE)
+                    bake = bake_area.contains(rect)
+                if bake:
+                    groups = [g for g in groups if g != 'visible']
+                tile = Tile(
+                    (x_pixel, y_pixel),
+                    [str_to_group[s] for s in groups],
+                    layer_name,
+                    graphic
+                )
+                tiles.append(tile)
+                if bake:
+                    baked.append((graphic, tile.rect))
+        return tiles, baked
+
+    def load_region(self, key: Tuple[int, int]) -> List[Tile]:
+        """ Create the tiles and floor of one map region (see world).
+
+        :param key: (column, row) of the region
+        :type  key: Tuple[int, int]
+        :return:    created tiles
+        :rtype:     List[Tile]
+        """
+        size = REGION_SIZE // TILE_SIZE  # tiles per region side
+        area = region_rect(key)
+        # seeded per region so tile variants survive unloading
+        rng = Random(key[1] * self.map_size[1] + key[0])
+        tiles, baked = self.create_tiles(
+            slice(key[1] * size, (key[1] + 1) * size),
+            slice(key[0] * size, (key[0] + 1) * size),
+            rng,
+            area
+        )
+        self.visible_sprites.load_floor(area, region_floor(key), baked)
+        return tiles
+
+    def unload_region(self, key: Tuple[int, int], tiles: List[Tile]) -> None:
+        """ Remove the tiles and floor of one map region (see world).
+
+        :param key:   (column, row) of the region
+        :type  key:   Tuple[int, int]
+        :param tiles: tiles load_region created
+        :type  tiles: List[Tile]
+        """
+        for tile in tiles:
+            tile.kill()
+        size = REGION_SIZE // TILE_SIZE  # tiles per region side
+        self.collision_grid.clear(
+            slice(key[1] * size, (key[1] + 1) * size),
+            slice(key[0] * size, (key[0] + 1) * size)
+        )
+        self.visible_sprites.drop_floor(region_rect(key))
+        ASSETS.release(region_floor_path(key), alpha=False)
+
+    def update(self, dt: float) -> None:
+        """ Advance level simulation by one step.
+
+        :param dt: simulated seconds to advance
+        :type  dt: float
+        """
+        if self.streamer is not None:
+            with PROFILER.section('stream'):
+                self.streamer.update(self.player.hitbox.center)
+        with PROFILER.section('update'):
+            self.entities.tick(dt)
+            self.visible_sprites.update(dt)  # sprites steer their entities
+            self.entities.step(dt, self.collision_grid)
+            self.player.sync()
+
+    def draw(self,
+             alpha: float = 1.0,
+             dirty_only: bool = False) -> List[pygame.Rect]:
+        """ Draw level and user interface.
+
+        :param alpha:      how far between the previous and latest simulation
+                           states to draw moving sprites, from 0 to 1
+        :type  alpha:      float, optional
+        :param dirty_only: only redraw screen areas that changed since the
+                           last draw, instead of the whole screen
+        :type  dirty_only: bool, optional
+        :return:           screen areas that were redrawn
+        :rtype:            List[pygame.Rect]
+        """
+        with PROFILER.section('ui'):
+            hud_dirty = self.user_interface.update(self.player)
+        with PROFILER.section('draw'):
+            areas = self.visible_sprites.custom_draw(
+                self.player, alpha, hud_dirty if dirty_only else None
+            )
+        with PROFILER.section('ui'):
+            self.user_interface.draw()
+        return areas
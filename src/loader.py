@@ -0,0 +1,136 @@
+"""
+This module implements background loading of level assets.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Dict
+import pygame
+from assets import ASSETS
+from atlas import atlas_index, source_files
+from utils import load_map_layer
+
+
+LOADER_WORKERS = 4
+POLL_BUDGET = 0.010  # seconds of main thread work per poll()
+
+
+class AssetLoader:
+    """ Decode images and parse map layers on a thread pool.
+
+        Workers only read files. Converting images for the display has to
+        happen on the main thread, which poll() does a little at a time, so a
+        loading screen can keep drawing. Once finished, the assets are in the
+        shared asset cache and map layer cache, so building the level (or the
+        next one) does no disk I/O.
+    """
+    def __init__(self, workers: int = LOADER_WORKERS) -> None:
+        """ Constructor.
+
+            :param workers: number of loader threads
+            :type  workers: int, optional
+        """
+        self.executor = ThreadPoolExecutor(workers, 'asset-loader')
+        self.pending = []  # (future, main thread callback) in queue order
+        self.queued = set()  # asset cache keys of queued images
+        self.total, self.done = 0, 0
+
+    def submit(self, load: Callable, finish: Callable = None) -> None:
+        """ Queue a loading job.
+
+            :param load:   runs on a worker thread, returns the loaded data
+            :type  load:   Callable
+            :param finish: runs on the main thread with the loaded data
+            :type  finish: Callable, optional
+        """
+        self.pending.append((self.executor.submit(load), finish))
+        self.total += 1
+
+    def add_image(self, path: str, alpha: bool = True) -> None:
+        """ Queue an image file for loading into the asset cache.
+
+            :param path:  path to image file
+            :type  path:  str
+            :param alpha: keep per-pixel alpha (convert_alpha vs convert)
+            :type  alpha: bool, optional
+        """
+        key = ASSETS.key(path, alpha)
+        if key in ASSETS.surfaces or key in self.queued:
+            return  # ex: several directories packed into one atlas
+        self.queued.add(key)
+        self.submit(
+            lambda: pygame.image.load(path),
+            lambda surface: ASSETS.insert(path, surface, alpha)
+        )
+
+    def add_image_dir(self, path: str) -> None:
+        """ Queue the PNG files of a directory (or their atlas) for loading.
+
+            :param path: path to directory with PNG files
+            :type  path: str
+        """
+        atlas_file = atlas_index().image_file(path)
+        if atlas_file is not None:
+            self.add_image(atlas_file)
+            return
+        for image_file in source_files(path):
+            self.add_image(image_file)
+
+    def add_map_layer(self, path: str) -> None:
+        """ Queue a map layer for parsing into the map layer cache.
+
+            :param path: path to map layer CSV file
+            :type  path: str
+        """
+        self.submit(lambda: load_map_layer(path))
+
+    def add_manifest(self, manifest: Dict[str, list]) -> None:
+        """ Queue everything a level lists as needed (see Level.manifest).
+
+            :param manifest: map layer paths, image directory paths and
+                             (image path, keeps alpha) pairs
+            :type  manifest: Dict[str, list]
+        """
+        for path in manifest['map_layers']:
+            self.add_map_layer(path)
+        for path in manifest['image_dirs']:
+            self.add_image_dir(path)
+        for path, alpha in manifest['images']:
+            self.add_image(path, alpha)
+
+    @property
+    def progress(self) -> float:
+        """ Fraction of queued jobs that are finished, from 0 to 1. """
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def finished(self) -> bool:
+        """ Whether every queued job is finished. """
+        return not self.pending
+
+    def poll(self, budget: float = POLL_BUDGET) -> float:
+        """ Finish loaded jobs on the main thread for up to a time budget.
+
+            :param budget: seconds to spend, at least one job is finished
+            :type  budget: float, optional
+            :return:       progress, from 0 to 1
+            :rtype:        float
+        """
+        deadline = perf_counter() + budget
+        still_pending = []
+        for idx, (future, finish) in enumerate(self.pending):
+            if not future.done():
+                still_pending.append((future, finish))
+                continue
+            data = future.result()  # re-raises loading errors here
+            if finish is not None:
+                finish(data)
+            self.done += 1
+            if perf_counter() > deadline:
+                still_pending.extend(self.pending[idx + 1:])
+                break
+        self.pending = still_pending
+        return self.progress
+
+    def close(self) -> None:
+        """ Stop the worker threads once queued jobs are done. """
+        self.executor.shutdown(wait=True)
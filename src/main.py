@@ -1,14 +1,40 @@
 """
 This module is the main module for the <title TBD> RPG game.
 """
+from time import perf_counter
+import argparse
+import os
+import random
 import sys
 import pygame
+from assets import ASSETS
+from controls import CONTROLS
 from levels import Level
+from loader import AssetLoader
+from memory import MEMORY
+from profiler import PROFILER
+from render import DISPLAY, RENDER_BACKEND, RENDER_BACKENDS, DynamicScale
+from ui import LoadingScreen
+import warmstart
 
 
 WIDTH = 1600
 HEIGHT = 900
-FPS = 20
+SIM_RATE = 20  # simulation steps per second, sets game speed
+MAX_FPS = 0  # render frame cap, 0 for uncapped
+VSYNC = False  # sync rendering to the monitor (uses a SCALED window)
+MAX_FRAME_TIME = 0.25  # seconds, longer frames drop simulation time
+DIRTY_RECTS = False  # only redraw/present screen areas that changed
+RENDER_SCALE = 1.0  # world resolution relative to the window (HUD stays 1)
+TARGET_FRAME_MS = None  # adjust RENDER_SCALE to hold this, None to not
+LOADING_FPS = 60
+BAKE_STATIC = False  # composite flat tiles (ex: grass) into floor chunks
+STREAM_WORLD = False  # only keep map regions near the player loaded
+ASSET_BUDGET = None  # max bytes of cached images, None for no limit
+RECORD_INPUT = None  # file to record input to, None to not record
+REPLAY_INPUT = None  # file to replay input from, None to play live
+WARM_START = True  # restore decoded images from a cache file (see warmstart)
+MEMORY_REPORT = None  # file to write surface memory accounting to on exit
 
 
 class Game:
@@ -18,26 +44,165 @@ class Game:
         # pylint: disable=no-member
         pygame.init()
         # pylint: enable=no-member
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        self.renderer = DISPLAY.open((WIDTH, HEIGHT), RENDER_BACKEND, VSYNC)
+        DISPLAY.scale = RENDER_SCALE
+        self.scaler = None if TARGET_FRAME_MS is None else \
+            DynamicScale(DISPLAY.world(), TARGET_FRAME_MS)
         self.clock = pygame.time.Clock()
-        self.level = Level()
-        pygame.display.set_caption('RPG')
+        ASSETS.budget = ASSET_BUDGET
+        self.level = self.load_level()
+
+    def load_level(self) -> Level:
+        """ Load assets and build the level.
+
+        With WARM_START, assets come from the warm-start cache instead when
+        it matches the asset files, and the cache is written otherwise.
+
+        :return: loaded level
+        :rtype:  Level
+        """
+        name = f'{"stream" if STREAM_WORLD else "level"}_{RENDER_BACKEND}'
+        key = warmstart.cache_key() if WARM_START else None
+        restored = key is not None and warmstart.restore(name, key)
+        if not restored:
+            self.load_assets()
+            if key is not None:
+                # before building, which can release images (see bake)
+                warmstart.save(name, key)
+        return self.build_level()
+
+    def load_assets(self) -> None:
+        """ Load level assets in the background behind a loading screen. """
+        loader = AssetLoader()
+        loader.add_manifest(Level.manifest(STREAM_WORLD))
+        loading_screen = LoadingScreen()
+        try:
+            while not loader.finished:
+                # pylint: disable=no-member
+                if any(e.type == pygame.QUIT for e in pygame.event.get()):
+                    pygame.quit()
+                    sys.exit()
+                # pylint: enable=no-member
+                loading_screen.display(loader.poll())
+                self.renderer.present()
+                self.clock.tick(LOADING_FPS)
+        finally:
+            loader.close()
+
+    def build_level(self) -> Level:
+        """ Build the level from loaded assets.
+
+        :return: built level
+        :rtype:  Level
+        """
+        # the same seed and input replay the same session
+        seed = random.randrange(2 ** 32)
+        if REPLAY_INPUT:
+            seed = CONTROLS.replay(REPLAY_INPUT, SIM_RATE)
+        elif RECORD_INPUT:
+            CONTROLS.record(RECORD_INPUT, SIM_RATE, seed)
+        random.seed(seed)
+        return Level(bake_static=BAKE_STATIC, stream=STREAM_WORLD)
 
     def run(self) -> None:
-        """ Start game engine. """
+        """ Start game engine.
+
+        The simulation advances in fixed steps of 1 / SIM_RATE seconds, as
+        many as the elapsed time calls for, while frames render as fast as
+        MAX_FPS/VSYNC allow and interpolate between the last two steps.
+        Replays use the recorded frame times instead, uncapped, and stop
+        at the end of the recording. With TARGET_FRAME_MS, the world's
+        render scale follows how long frames take (without the cap's wait).
+        """
         # pylint: disable=no-member
+        step, accumulator = 1 / SIM_RATE, 0.0
+        max_fps = 0 if REPLAY_INPUT else MAX_FPS
+        frames, start = 0, perf_counter()
+        self.clock.tick()  # do not count setup time as elapsed
+        MEMORY.reset()  # only watch churn and growth after loading
         events = pygame.event.get()
         while all(e.type != pygame.QUIT for e in events):
-            self.screen.fill('black')
-            self.level.run()
-            pygame.display.update()
-            self.clock.tick(FPS)
-            events = pygame.event.get()
+            elapsed = CONTROLS.frame(self.clock.tick(max_fps))
+            if CONTROLS.finished:
+                break
+            accumulator += min(elapsed / 1000, MAX_FRAME_TIME)
+            frames += 1
+            frame_start = perf_counter()
+            with PROFILER.section('frame'):
+                while accumulator >= step:
+                    self.level.update(step)
+                    accumulator -= step
+                areas = self.level.draw(accumulator / step, DIRTY_RECTS)
+                with PROFILER.section('present'):
+                    self.renderer.present(areas if DIRTY_RECTS else None)
+                with PROFILER.section('events'):
+                    events = pygame.event.get()
+                    if any(e.type == pygame.KEYDOWN and e.key == pygame.K_F3
+                           for e in events):
+                        PROFILER.overlay = not PROFILER.overlay
+            if self.scaler is not None:
+                self.scaler.update((perf_counter() - frame_start) * 1000)
+            PROFILER.end_frame()
+            MEMORY.end_frame()
+        if REPLAY_INPUT:
+            print(f'replayed {frames} frames in '
+                  f'{perf_counter() - start:.2f} s')
+        CONTROLS.close()
+        PROFILER.close()
+        if MEMORY_REPORT:
+            MEMORY.write(MEMORY_REPORT)
         pygame.quit()
         # pylint: enable=no-member
         sys.exit()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='RPG game')
+    parser.add_argument('--profile', action='store_true',
+                        help='time frame phases, F3 toggles the overlay')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='write per-frame phase timings on exit, as '
+                             'Chrome trace JSON if PATH ends in .json, '
+                             'else CSV')
+    parser.add_argument('--dirty', action='store_true',
+                        help='only redraw and present areas that changed')
+    parser.add_argument('--stream', action='store_true',
+                        help='only keep map regions near the player loaded')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record input and frame times to a file')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='replay a recording as fast as possible')
+    parser.add_argument('--headless', action='store_true',
+                        help='run without a window (SDL dummy driver)')
+    parser.add_argument('--renderer', choices=RENDER_BACKENDS,
+                        default=RENDER_BACKEND,
+                        help='draw with software blits onto the display '
+                             'surface, or with SDL Renderer textures')
+    parser.add_argument('--memory', metavar='PATH',
+                        help='track surface memory by origin and write a '
+                             'JSON report on exit')
+    parser.add_argument('--render-scale', type=float, default=RENDER_SCALE,
+                        help='draw the world at this fraction of the window '
+                             'resolution (ex: 0.5), then scale it up')
+    parser.add_argument('--target-ms', type=float, default=TARGET_FRAME_MS,
+                        help='adjust the render scale to hold this frame '
+                             'time in milliseconds')
+    parser.add_argument('--cold', action='store_true',
+                        help='ignore the warm-start cache')
+    args = parser.parse_args()
+    if args.headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    RECORD_INPUT, REPLAY_INPUT = args.record, args.replay
+    WARM_START = WARM_START and not args.cold
+    RENDER_BACKEND = args.renderer
+    MEMORY_REPORT = args.memory
+    RENDER_SCALE, TARGET_FRAME_MS = args.render_scale, args.target_ms
+    MEMORY.enabled = bool(args.memory)
+    DIRTY_RECTS = DIRTY_RECTS or args.dirty
+    STREAM_WORLD = STREAM_WORLD or args.stream
+    PROFILER.enabled = PROFILER.overlay = args.profile
+    if args.trace:
+        PROFILER.start_trace(args.trace)
     game = Game()
     game.run()
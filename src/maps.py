@@ -0,0 +1,71 @@
+"""
+This module implements the compiled (binary) level map layer format.
+
+Layers are stored as NumPy .npy files next to the CSV files exported from
+the map editor, so they can be memory-mapped instead of parsed. Run it as a
+script (from this directory) to compile every layer:
+    python maps.py
+"""
+from typing import Optional
+import os
+from glob import glob
+import numpy as np
+
+
+MAP_DIR = '../map'
+MAP_DTYPE = np.int16  # tile ids are small, -1 marks an empty cell
+
+
+def compiled_path(path: str) -> str:
+    """ Get path of the compiled version of a map layer CSV file.
+
+    :param path: path to map layer CSV file
+    :type  path: str
+    :return:     path to compiled map layer file
+    :rtype:      str
+    """
+    return os.path.splitext(path)[0] + '.npy'
+
+
+def parse_layer(path: str) -> np.ndarray:
+    """ Parse map layer stored in CSV file.
+
+    :param path: path to map layer CSV file
+    :type  path: str
+    :return:     map layer (rows x columns)
+    :rtype:      np.ndarray
+    """
+    layer = np.loadtxt(path, delimiter=',', dtype=np.int64, ndmin=2)
+    info = np.iinfo(MAP_DTYPE)
+    assert info.min <= layer.min() and layer.max() <= info.max, \
+        f'{path} has tile ids out of {MAP_DTYPE.__name__} range'
+    return layer.astype(MAP_DTYPE)
+
+
+def compile_layer(path: str) -> None:
+    """ Compile map layer CSV file to a .npy file next to it.
+
+    :param path: path to map layer CSV file
+    :type  path: str
+    """
+    np.save(compiled_path(path), parse_layer(path))
+
+
+def compiled_layer(path: str) -> Optional[np.ndarray]:
+    """ Memory-map the compiled version of a map layer if it is up to date.
+
+    :param path: path to map layer CSV file
+    :type  path: str
+    :return:     read-only map layer, None if not compiled or outdated
+    :rtype:      Optional[np.ndarray]
+    """
+    npy_path = compiled_path(path)
+    if not os.path.exists(npy_path) or \
+            os.path.getmtime(npy_path) < os.path.getmtime(path):
+        return None
+    return np.load(npy_path, mmap_mode='r')
+
+
+if __name__ == '__main__':
+    for csv_path in sorted(glob(os.path.join(MAP_DIR, '*.csv'))):
+        compile_layer(csv_path)
@@ -0,0 +1,205 @@
+"""
+This module implements accounting of the memory that surfaces take, by
+where they come from, to catch leaks and churn.
+"""
+from collections import deque
+from typing import Dict, List
+import json
+import weakref
+import pygame
+
+
+MEMORY_WINDOW = 300  # frames of rolling churn statistics
+MEMORY_CHECK_FRAMES = 600  # frames between growth checks
+MEMORY_GROWTH_CHECKS = 5  # checks in a row an origin must grow to be flagged
+
+
+class SurfaceTracker:
+    """ Live surfaces and their bytes, grouped by origin (ex: 'Tile').
+
+        Code that creates or loads a surface passes it through track() with
+        its origin, and end_frame() is called once per frame. Surfaces are
+        watched through weak references, so tracking never keeps one alive
+        and frees are counted as they happen. Subsurfaces count as
+        surfaces but not bytes, their pixels belong to their parent.
+
+        Every MEMORY_CHECK_FRAMES frames each origin's live surfaces and
+        bytes are checked, and origins that grew at MEMORY_GROWTH_CHECKS
+        checks in a row are flagged as growing: a steady level should stop
+        creating surfaces it keeps. Disabled trackers only cost a method
+        call per surface.
+    """
+    def __init__(self,
+                 window: int = MEMORY_WINDOW,
+                 check_frames: int = MEMORY_CHECK_FRAMES,
+                 growth_checks: int = MEMORY_GROWTH_CHECKS) -> None:
+        """ Constructor.
+
+            :param window:        frames to keep churn statistics over
+            :type  window:        int, optional
+            :param check_frames:  frames between growth checks
+            :type  check_frames:  int, optional
+            :param growth_checks: checks in a row an origin must grow by
+            :type  growth_checks: int, optional
+        """
+        self.enabled = False
+        self.window = window
+        self.check_frames = check_frames
+        self.growth_checks = growth_checks
+        self.watched = {}  # id(surface) -> (weak reference, origin, bytes)
+        self.origins = {}  # origin -> live, bytes, peak bytes, created, freed
+        self.current = {}  # origin -> [created, freed] this frame
+        self.churn = {}  # origin -> deque of per-frame (created, freed)
+        self.checks = {}  # origin -> deque of (live, bytes) at checks
+        self.frame_count = 0
+
+    def reset(self) -> None:
+        """ Forget churn, growth checks and the frame count.
+
+            Surfaces already tracked stay tracked, and totals stay as they
+            are (ex: to only watch a level after it loaded).
+        """
+        self.current = {}
+        self.churn = {}
+        self.checks = {}
+        self.frame_count = 0
+
+    @staticmethod
+    def nbytes(surface: pygame.Surface) -> int:
+        """ Get number of bytes of pixel data a surface owns.
+
+            :param surface: surface to measure
+            :type  surface: pygame.Surface
+            :return:        bytes of pixel data, 0 for subsurfaces
+            :rtype:         int
+        """
+        if surface.get_parent() is not None:
+            return 0
+        return surface.get_pitch() * surface.get_height()
+
+    def track(self, surface: pygame.Surface, origin: str) -> pygame.Surface:
+        """ Count a surface as live until it gets freed.
+
+            Surfaces already tracked keep their first origin.
+
+            :param surface: surface that was just created or loaded
+            :type  surface: pygame.Surface
+            :param origin:  what made it (ex: 'Tile', or an image directory)
+            :type  origin:  str
+            :return:        the same surface, to wrap creation calls
+            :rtype:         pygame.Surface
+        """
+        if not self.enabled:
+            return surface
+        key = id(surface)
+        if key in self.watched and self.watched[key][0]() is surface:
+            return surface
+        nbytes = self.nbytes(surface)
+        self.watched[key] = (
+            weakref.ref(surface, lambda ref: self.forget(key)),
+            origin, nbytes
+        )
+        stats = self.origins.setdefault(
+            origin,
+            {'live': 0, 'bytes': 0, 'peak_bytes': 0, 'created': 0, 'freed': 0}
+        )
+        stats['live'] += 1
+        stats['bytes'] += nbytes
+        stats['peak_bytes'] = max(stats['peak_bytes'], stats['bytes'])
+        stats['created'] += 1
+        self.current.setdefault(origin, [0, 0])[0] += 1
+        return surface
+
+    def forget(self, key: int) -> None:
+        """ Count a tracked surface as freed (its weak reference died).
+
+            :param key: id the surface had
+            :type  key: int
+        """
+        _, origin, nbytes = self.watched.pop(key)
+        stats = self.origins[origin]
+        stats['live'] -= 1
+        stats['bytes'] -= nbytes
+        stats['freed'] += 1
+        self.current.setdefault(origin, [0, 0])[1] += 1
+
+    def end_frame(self) -> None:
+        """ Move this frame's churn into the rolling window, and check for
+            growth every check_frames frames.
+        """
+        if not self.enabled:
+            return
+        for origin in self.origins:
+            if origin not in self.churn:
+                self.churn[origin] = deque(maxlen=self.window)
+            self.churn[origin].append(tuple(self.current.get(origin, (0, 0))))
+        self.current = {}
+        self.frame_count += 1
+        if self.frame_count % self.check_frames == 0:
+            for origin, stats in self.origins.items():
+                if origin not in self.checks:
+                    self.checks[origin] = deque(maxlen=self.growth_checks + 1)
+                self.checks[origin].append((stats['live'], stats['bytes']))
+
+    def growing(self) -> List[str]:
+        """ List origins that grew at each of the last growth checks.
+
+            :return: origins whose live surfaces or bytes rose (and neither
+                     fell) between every pair of the last checks
+            :rtype:  List[str]
+        """
+        flagged = []
+        for origin, checks in self.checks.items():
+            if len(checks) <= self.growth_checks:
+                continue
+            pairs = list(zip(checks, list(checks)[1:]))
+            if all(new != old and new[0] >= old[0] and new[1] >= old[1]
+                   for old, new in pairs):
+                flagged.append(origin)
+        return sorted(flagged)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """ Summarize every origin.
+
+            :return: origin -> live surfaces, bytes, peak bytes, total
+                     created and freed, and mean created and freed per
+                     frame over the rolling window
+            :rtype:  Dict[str, Dict[str, float]]
+        """
+        summary = {}
+        for origin, stats in sorted(self.origins.items()):
+            churn = self.churn.get(origin) or [(0, 0)]
+            summary[origin] = dict(
+                stats,
+                created_per_frame=sum(c for c, _ in churn) / len(churn),
+                freed_per_frame=sum(f for _, f in churn) / len(churn)
+            )
+        return summary
+
+    def report(self) -> Dict:
+        """ Get totals, per-origin statistics and growing origins.
+
+            :return: frames tracked, live surfaces and bytes, origins (see
+                     stats) and growing origins (see growing)
+            :rtype:  Dict
+        """
+        origins = self.stats()
+        return {
+            'frames': self.frame_count,
+            'live': sum(stats['live'] for stats in origins.values()),
+            'bytes': sum(stats['bytes'] for stats in origins.values()),
+            'origins': origins,
+            'growing': self.growing()
+        }
+
+    def write(self, path: str) -> None:
+        """ Write the report as JSON.
+
+            :param path: output file
+            :type  path: str
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, indent=1)
+
+
+MEMORY = SurfaceTracker()  # shared by every module that makes surfaces
@@ -0,0 +1,261 @@
+"""
+This module implements a navigation grid and flow fields that steer any
+number of entities toward shared targets.
+"""
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Tuple
+import numpy as np
+from tile import TILE_SIZE
+
+
+NAV_RANGE = 96  # cells a flow field spreads from its target, bounds its cost
+FLOW_CACHE_SIZE = 16  # flow fields kept for fixed targets, least recent out
+UNREACHED = np.iinfo(np.int32).max  # distance where a field does not reach
+# (column, row) steps to the 8 neighbors, orthogonal first
+NEIGHBOR_STEPS = np.array([(0, -1), (0, 1), (-1, 0), (1, 0),
+                           (-1, -1), (1, -1), (-1, 1), (1, 1)], dtype=np.int8)
+DIAGONAL_SIDES = [(4, 0, 2), (5, 0, 3), (6, 1, 2), (7, 1, 3)]  # diag, orth
+
+
+def walkable_cells(
+        shape: Tuple[int, int],
+        obstacles: Iterable[Tuple[np.ndarray, Tuple[int, int, int, int]]]
+        ) -> np.ndarray:
+    """ Find the map cells that no obstacle's hitbox overlaps.
+
+    :param shape:     rows, columns of the map
+    :type  shape:     Tuple[int, int]
+    :param obstacles: where obstacles are (True at their map cells), and
+                      the cells their hitboxes overlap relative to those
+                      (see tile.footprint)
+    :type  obstacles: Iterable[Tuple[np.ndarray, Tuple[int, int, int, int]]]
+    :return:          True where walkable (rows x columns)
+    :rtype:           np.ndarray
+    """
+    walkable = np.ones(shape, dtype=bool)
+    for cells, (top, left, bottom, right) in obstacles:
+        rows, cols = min(cells.shape[0], shape[0]), \
+            min(cells.shape[1], shape[1])
+        for row_offset in range(top, bottom + 1):
+            for col_offset in range(left, right + 1):
+                # cells whose offset cell is still on the map
+                row_start, col_start = max(0, -row_offset), \
+                    max(0, -col_offset)
+                row_end = min(rows, shape[0] - row_offset)
+                col_end = min(cols, shape[1] - col_offset)
+                if row_end <= row_start or col_end <= col_start:
+                    continue
+                walkable[row_start + row_offset:row_end + row_offset,
+                         col_start + col_offset:col_end + col_offset] &= \
+                    ~cells[row_start:row_end, col_start:col_end]
+    return walkable
+
+
+class FlowField:
+    """ Next step toward one target cell from every cell that reaches it.
+
+        Every entity heading to the target samples the same field, so its
+        cost is paid once per target cell however many entities follow it.
+    """
+    def __init__(self,
+                 target: Tuple[int, int],
+                 distance: np.ndarray,
+                 step: np.ndarray,
+                 cell_size: int = TILE_SIZE) -> None:
+        """ Constructor. See NavigationGrid.build.
+
+            :param target:    (column, row) of the target cell
+            :type  target:    Tuple[int, int]
+            :param distance:  cells to walk to the target (rows x columns),
+                              UNREACHED where out of range or cut off
+            :type  distance:  np.ndarray
+            :param step:      (column, row) step toward the target of each
+                              cell (rows x columns x 2), 0 where none
+            :type  step:      np.ndarray
+            :param cell_size: width and height of a cell in pixels
+            :type  cell_size: int, optional
+        """
+        self.target = target
+        self.distance = distance
+        self.step = step
+        self.cell_size = cell_size
+
+    def directions(self, points: np.ndarray) -> np.ndarray:
+        """ Get which way to go toward the target from many points at once.
+
+            Each direction points at the center of the next cell on the
+            way, so entities follow the path instead of cutting corners.
+
+            :param points: (x, y) rows in world pixels
+            :type  points: np.ndarray
+            :return:       (x, y) direction of each point, not normalized,
+                           (0, 0) in the target cell and where unreached
+            :rtype:        np.ndarray
+        """
+        size = self.cell_size
+        rows, cols = self.distance.shape
+        cells = np.asarray(points) // size  # (col, row)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < cols) & \
+            (cells[:, 1] >= 0) & (cells[:, 1] < rows)
+        step = np.zeros((len(cells), 2), dtype=np.int64)
+        step[inside] = self.step[cells[inside, 1], cells[inside, 0]]
+        moving = step.any(axis=1)
+        centers = (cells + step) * size + size // 2
+        return np.where(moving[:, None], centers - points, 0.0)
+
+
+class NavigationGrid:
+    """ Walkable map cells and the flow fields built over them.
+
+        Fields toward fixed targets (ex: a spawn point) are kept in a
+        least-recently-used cache by target cell. Moving targets (ex: the
+        player) are tracked by name and get a new field only when they
+        move to another cell, which every follower then shares. Which
+        cells are walkable is only worked out once the first field is
+        built, so levels nothing navigates on do not pay for it.
+    """
+    def __init__(self,
+                 shape: Tuple[int, int],
+                 walkable: Callable[[], np.ndarray],
+                 cell_size: int = TILE_SIZE,
+                 reach: int = NAV_RANGE,
+                 cache_size: int = FLOW_CACHE_SIZE) -> None:
+        """ Constructor.
+
+            :param shape:      rows, columns of the map
+            :type  shape:      Tuple[int, int]
+            :param walkable:   gets True where walkable (rows x columns),
+                               called once, on first use
+            :type  walkable:   Callable[[], np.ndarray]
+            :param cell_size:  width and height of a cell in pixels
+            :type  cell_size:  int, optional
+            :param reach:      cells a field spreads from its target
+            :type  reach:      int, optional
+            :param cache_size: flow fields kept for fixed targets
+            :type  cache_size: int, optional
+        """
+        self.shape = shape
+        self.cell_size = cell_size
+        self.reach = reach
+        self.cache_size = cache_size
+        self.walkable = walkable
+        self.padded = None  # walkable with a blocked border, see build
+        width = self.shape[1] + 2
+        steps = NEIGHBOR_STEPS.astype(np.int64)
+        self.offsets = steps[:, 0] + steps[:, 1] * width  # flat index steps
+        self.fields = OrderedDict()  # target cell -> field, LRU first
+        self.tracked = {}  # target name -> field
+        self.builds, self.hits = 0, 0
+
+    def cell(self, point: Tuple[int, int]) -> Tuple[int, int]:
+        """ Get the cell a point is in, the closest one if off the map.
+
+            :param point: (x, y) in world pixels
+            :type  point: Tuple[int, int]
+            :return:      (column, row) of the cell
+            :rtype:       Tuple[int, int]
+        """
+        rows, cols = self.shape
+        return min(max(point[0] // self.cell_size, 0), cols - 1), \
+            min(max(point[1] // self.cell_size, 0), rows - 1)
+
+    def field(self, target: Tuple[int, int]) -> FlowField:
+        """ Get the flow field toward a fixed target, building it on miss.
+
+            :param target: (column, row) of the target cell
+            :type  target: Tuple[int, int]
+            :return:       shared flow field, do not modify it
+            :rtype:        FlowField
+        """
+        field = self.fields.get(target)
+        if field is not None:
+            self.hits += 1
+            self.fields.move_to_end(target)
+            return field
+        field = self.fields[target] = self.build(target)
+        if len(self.fields) > self.cache_size:
+            self.fields.popitem(last=False)
+        return field
+
+    def track(self, name: str, point: Tuple[int, int]) -> FlowField:
+        """ Get the flow field toward a moving target, wherever it is now.
+
+            :param name:  what the target is (ex: 'player')
+            :type  name:  str
+            :param point: (x, y) of the target in world pixels
+            :type  point: Tuple[int, int]
+            :return:      shared flow field, do not modify it
+            :rtype:       FlowField
+        """
+        target = self.cell(point)
+        field = self.tracked.get(name)
+        if field is not None and field.target == target:
+            self.hits += 1
+            return field
+        field = self.tracked[name] = self.build(target)
+        return field
+
+    def build(self, target: Tuple[int, int]) -> FlowField:
+        """ Build a flow field with a breadth-first search from its target.
+
+            The search spreads over orthogonal neighbors, a whole wavefront
+            at a time, and stops after self.reach cells. Each reached cell
+            then steps to its closest neighbor, diagonals included unless
+            they cut a blocked corner.
+
+            :param target: (column, row) of the target cell, on the map,
+                           reached even if blocked (ex: the player brushing
+                           an obstacle)
+            :type  target: Tuple[int, int]
+            :return:       new flow field
+            :rtype:        FlowField
+        """
+        self.builds += 1
+        if self.padded is None:
+            # blocked border, so neighbors of any cell are in bounds
+            self.padded = np.pad(self.walkable(), 1).ravel()
+        rows, cols = self.shape
+        width = cols + 2
+        walkable, offsets = self.padded, self.offsets
+        distance = np.full(walkable.shape, UNREACHED, dtype=np.int32)
+        step = np.zeros(walkable.shape + (2,), dtype=np.int8)
+        col, row = target
+        frontier = np.array([(row + 1) * width + col + 1])
+        distance[frontier] = 0
+        reached = [frontier]
+        for cost in range(1, self.reach + 1):
+            cells = (frontier[:, None] + offsets[:4]).ravel()
+            cells = np.unique(
+                cells[walkable[cells] & (distance[cells] == UNREACHED)]
+            )
+            if not len(cells):
+                break
+            distance[cells] = cost
+            reached.append(cells)
+            frontier = cells
+
+        cells = np.concatenate(reached)
+        around = distance[cells[:, None] + offsets]  # cells x neighbors
+        for diagonal, side_a, side_b in DIAGONAL_SIDES:
+            cut = (around[:, side_a] == UNREACHED) | \
+                (around[:, side_b] == UNREACHED)
+            around[cut, diagonal] = UNREACHED
+        best = around.argmin(axis=1)
+        closer = around[np.arange(len(cells)), best] < distance[cells]
+        step[cells[closer]] = NEIGHBOR_STEPS[best[closer]]
+
+        return FlowField(
+            (col, row),
+            distance.reshape(rows + 2, width)[1:-1, 1:-1],
+            step.reshape(rows + 2, width, 2)[1:-1, 1:-1],
+            self.cell_size
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """ Get counters of flow fields built and reused. """
+        return {
+            'builds': self.builds,
+            'hits': self.hits,
+            'cached': len(self.fields),
+            'tracked': len(self.tracked)
+        }
@@ -3,13 +3,19 @@ This module implements the player asset.
 """
 from typing import List, Tuple
 import pygame
-from utils import load_graphics
+from animation import ATTACK, CLIP_FPS, FACING_STATE, IDLE, MOVE, clip_dirs, \
+    load_clips
+from assets import ASSETS
+from controls import CONTROLS
+from entities import EntityStore
+from pool import SpritePool
 
 
-SPEED = 20  # pixels per second
-CHANGE_WEAPON_COOLDOWN = 150
-ATTACK_COOLDOWN = 100
-ANIMATION_SPEED = 0.25
+SPEED = 400  # pixels per second
+CHANGE_WEAPON_COOLDOWN = 150  # milliseconds
+ATTACK_COOLDOWN = 100  # milliseconds
+PLAYER_GRAPHICS = '../graphics/player'  # one subdirectory per clip
+ATTACK_TIMER, CHANGE_WEAPON_TIMER = 0, 1  # entity cooldown timers
 WEAPON_DATA = [
     {
         'type': 'sword',
@@ -43,91 +49,108 @@ WEAPON_DATA = [
     }
 ]
 N_WEAPONS = len(WEAPON_DATA)
+PLAYER_CLIP_DIRS = clip_dirs(PLAYER_GRAPHICS)
+# offset placement away from player and adjust for player's sprite arm
+WEAPON_PLACEMENT = {  # facing -> weapon anchor, player anchor, offset
+    'right': ('midleft', 'midright', (0, 16)),
+    'left': ('midright', 'midleft', (0, 16)),
+    'down': ('midtop', 'midbottom', (-10, 0)),
+    'up': ('midbottom', 'midtop', (-10, 0))
+}
+
+
+def weapon_graphic(weapon_idx: int, facing: str) -> str:
+    """ Get path of the image of a weapon held in some direction.
+
+    :param weapon_idx: index into WEAPON_DATA
+    :type  weapon_idx: int
+    :param facing:     direction the holder faces (ex: 'up')
+    :type  facing:     str
+    :return:           path to image file
+    :rtype:            str
+    """
+    weapon_type = WEAPON_DATA[weapon_idx]['type']
+    return f'../graphics/weapons/{weapon_type}/{facing}.png'
 
 
 class Player(pygame.sprite.Sprite):
     """ Player asset for levels. """
+    dynamic = True  # moves every frame, so cameras depth-sort it per frame
+
     def __init__(self,
                  pos: Tuple[int, int],
                  groups: List[pygame.sprite.Group],
-                 obstacles: pygame.sprite.Group) -> None:
+                 entities: EntityStore,
+                 weapon_pool: SpritePool) -> None:
         """ Constructor.
 
-        :param pos:       location of top-left corner in pixels (x, y)
-        :type  pos:       Tuple[int, int]
-        :param groups:    sprite groups containing this tile
-        :type  groups:    List[pygame.sprite.Group]
-        :param obstacles: group for sprites player cannot pass through
-        :type  obstackes: pygame.sprite.Group
+        :param pos:         location of top-left corner in pixels (x, y)
+        :type  pos:         Tuple[int, int]
+        :param groups:      sprite groups containing this tile
+        :type  groups:      List[pygame.sprite.Group]
+        :param entities:    store that moves the player (see sync)
+        :type  entities:    EntityStore
+        :param weapon_pool: pool of Weapon sprites to show when attacking
+        :type  weapon_pool: SpritePool
         """
         super().__init__(groups)
 
-        # load player image assets
-        self.image_lookup = {}
-        for player_state in [
-            'up',
-            'up_idle',
-            'up_attack',
-            'down',
-            'down_idle',
-            'down_attack',
-            'left',
-            'left_idle',
-            'left_attack',
-            'right',
-            'right_idle',
-            'right_attack'
-        ]:
-            self.image_lookup[player_state] = load_graphics(
-                f'../graphics/player/{player_state}'
-            )
+        # animation clips, shared by every player
+        self.clips = load_clips(PLAYER_GRAPHICS, CLIP_FPS)
 
         # set initial player status values
         self.health, self.max_health = 80, 100
         self.mana, self.max_mana = 50, 75
         self.exp = 420
         self.weapon_idx = 0
-        self.can_change_weapon, self.change_weapon_time = True, 0
-        self.is_attacking, self.attack_start_time = False, None
+        self.can_change_weapon = True
+        self.is_attacking = False
         # pylint: disable=c-extension-no-member
         self.facing = 'down'
         self.is_still, self.direction = True, pygame.math.Vector2()
         # pylint: enable=c-extension-no-member
 
         # set initial image to display
-        self.frame_idx = 0
-        self.image = self.image_lookup['down_idle'][0]
+        self.state = FACING_STATE[self.facing] + IDLE
+        self.image = self.clips.image(self.state, 0.0)
         self.rect = self.image.get_rect(topleft=pos)
         self.hitbox = self.rect.inflate(0, -26)  # pixels to add/sub
+        self.old_rect = self.rect.copy()  # rect before the latest update
         self.weapon = None  # weapon sprite on screen
 
+        # position, animation and cooldowns live in the entity store
+        self.entities = entities
+        self.eid = entities.add(
+            self.hitbox, SPEED, self.clips, self.state, drawn=False
+        )
+
         # other
-        self.obstacles = obstacles  # for collision handling
+        self.weapon_pool = weapon_pool
 
     def get_input(self) -> None:
         """ Get user input and update player status. """
-        keys = pygame.key.get_pressed()
+        keys = CONTROLS.keys
 
         # WEAPON CHANGE
         # pylint: disable=no-member
         if keys[pygame.K_q] and self.can_change_weapon:
             self.weapon_idx = (self.weapon_idx + 1) % N_WEAPONS
             self.can_change_weapon = False
-            self.change_weapon_time = pygame.time.get_ticks()
+            self.entities.timers[self.eid, CHANGE_WEAPON_TIMER] = 0
         # pylint: enable=no-member
 
         # ATTACK
         # pylint: disable=no-member
         if keys[pygame.K_LSHIFT]:
             self.is_attacking = True
-            self.attack_start_time = pygame.time.get_ticks()
+            self.entities.timers[self.eid, ATTACK_TIMER] = 0
         # pylint: enable=no-member
 
         # MAGIC
         # pylint: disable=no-member
         if keys[pygame.K_LCTRL]:
             self.is_attacking = True
-            self.attack_start_time = pygame.time.get_ticks()
+            self.entities.timers[self.eid, ATTACK_TIMER] = 0
         # pylint: enable=no-member
 
         # MOVEMENT
@@ -153,105 +176,100 @@ class Player(pygame.sprite.Sprite):
         # pylint: enable=no-member
         self.is_still = self.direction.x == 0 and self.direction.y == 0
 
-    def handle_collision(self, direction: str) -> None:
-        """ Prevent player from moving through certain sprites.
-
-            :param direction: direction in which to check collisions
-            :type  direction: str
-        """
-        if direction == 'horizontal':
-            for sprite in self.obstacles:
-                if sprite.hitbox.colliderect(self.hitbox):
-                    if self.direction.x > 0:
-                        self.hitbox.right = sprite.hitbox.left
-                    if self.direction.x < 0:
-                        self.hitbox.left = sprite.hitbox.right
-
-        if direction == 'vertical':
-            for sprite in self.obstacles:
-                if sprite.hitbox.colliderect(self.hitbox):
-                    if self.direction.y > 0:
-                        self.hitbox.bottom = sprite.hitbox.top
-                    if self.direction.y < 0:
-                        self.hitbox.top = sprite.hitbox.bottom
-
     def apply_cooldown(self) -> None:
         """ Check timers and update player status accordingly. """
-        current_time = pygame.time.get_ticks()
+        timers = self.entities.timers[self.eid]  # ms since each reset
         self.is_attacking = self.is_attacking and \
-            current_time - self.attack_start_time < ATTACK_COOLDOWN
+            bool(timers[ATTACK_TIMER] < ATTACK_COOLDOWN)
         self.can_change_weapon = \
-            current_time - self.change_weapon_time > CHANGE_WEAPON_COOLDOWN
+            bool(timers[CHANGE_WEAPON_TIMER] > CHANGE_WEAPON_COOLDOWN)
 
-    def get_status_str(self) -> str:
-        """ Create image lookup string from status info. """
-        status = []
-        status.append(self.facing)
+    def set_state(self) -> None:
+        """ Pick the clip the entity store plays for player status. """
         if self.is_attacking:
-            status.append('attack')
+            action = ATTACK
         elif self.is_still:
-            status.append('idle')
-        return '_'.join(status)
+            action = IDLE
+        else:
+            action = MOVE
+        self.state = FACING_STATE[self.facing] + action
+        self.entities.state[self.eid] = self.state
+        self.entities.direction[self.eid] = self.direction
 
     def set_image(self) -> None:
-        """ Change sprite based on player status. """
-        frames = self.image_lookup[self.get_status_str()]
-        self.frame_idx = (self.frame_idx + ANIMATION_SPEED) % len(frames)
-        self.image = frames[int(self.frame_idx)]
+        """ Change sprite to the entity store's animation frame. """
+        self.image = self.entities.image(self.eid)
         self.rect = self.image.get_rect(center=self.hitbox.center)
 
-    def move(self) -> None:
-        """ Update player location in game. """
-        if self.direction.magnitude() != 0:
-            self.direction = self.direction.normalize()
-        self.hitbox.x += SPEED * self.direction.x
-        self.handle_collision('horizontal')
-        self.hitbox.y += SPEED * self.direction.y
-        self.handle_collision('vertical')
-        self.rect.center = self.hitbox.center
-
     def show_weapon(self) -> None:
-        """ Create and show weapon sprite if player is attacking. """
-        if self.weapon is not None:
-            self.weapon.kill()
+        """ Show weapon sprite if player is attacking, else hide it. """
         if self.is_attacking:
-            self.weapon = Weapon(self)
+            if self.weapon is None:
+                self.weapon = self.weapon_pool.acquire()
+            self.weapon.place(self)
+        elif self.weapon is not None:
+            self.weapon_pool.release(self.weapon)
+            self.weapon = None
+
+    # pylint: disable=unused-argument
+    def update(self, dt: float) -> None:
+        """ Check user input and tell the entity store where to move.
+
+            The store moves and animates the player afterwards (see sync).
 
-    def update(self) -> None:
-        """ Check user input for movement and move. """
+            :param dt: simulated seconds since the last update
+            :type  dt: float
+        """
+        self.old_rect = self.rect.copy()
         self.get_input()
         self.apply_cooldown()
+        self.set_state()
+    # pylint: enable=unused-argument
+
+    def sync(self) -> None:
+        """ Copy the player's state back from the entity store. """
+        self.hitbox.update(self.entities.rect(self.eid))
         self.set_image()
-        self.move()
         self.show_weapon()
 
 
 class Weapon(pygame.sprite.Sprite):
-    """ Weapon asset. """
-    def __init__(self, player: Player) -> None:
-        """ Constructor.
+    """ Weapon asset, pooled and placed in front of an attacking player. """
+    dynamic = True  # follows the player
+
+    def __init__(self, groups: List[pygame.sprite.Group]) -> None:
+        """ Constructor. Hidden until placed (see SpritePool).
+
+            :param groups: sprite groups containing this weapon
+            :type  groups: List[pygame.sprite.Group]
+        """
+        super().__init__(groups)
+        self.visible = False
+        self.images = {
+            (weapon_idx, facing): ASSETS.image(
+                weapon_graphic(weapon_idx, facing)
+            )
+            for weapon_idx in range(N_WEAPONS)
+            for facing in WEAPON_PLACEMENT
+        }
+        self.image = self.images[0, 'down']
+        self.rect = self.image.get_rect()
+        self.old_rect = self.rect.copy()
+
+    def place(self, player: Player) -> None:
+        """ Show the player's current weapon in front of them, in place.
 
-            :param player: player that owns the weapon
+            :param player: player that holds the weapon
             :type  player: Player
         """
-        super().__init__(player.groups())
-        weapon_type = WEAPON_DATA[player.weapon_idx]['type']
-        self.image = pygame.image.load(
-            f'../graphics/weapons/{weapon_type}/{player.facing}.png'
-        ).convert_alpha()
+        self.image = self.images[player.weapon_idx, player.facing]
+        anchor, player_anchor, (x_offset, y_offset) = \
+            WEAPON_PLACEMENT[player.facing]
+        x_pixel, y_pixel = getattr(player.rect, player_anchor)
+        self.rect.size = self.image.get_size()
+        setattr(self.rect, anchor, (x_pixel + x_offset, y_pixel + y_offset))
 
-        # offset placement away from player and adjust for player's sprite arm
-        # pylint: disable=c-extension-no-member
-        if player.facing == 'right':
-            self.rect = self.image.get_rect(midleft=player.rect.midright +
-                                            pygame.math.Vector2(0, 16))
-        elif player.facing == 'left':
-            self.rect = self.image.get_rect(midright=player.rect.midleft +
-                                            pygame.math.Vector2(0, 16))
-        elif player.facing == 'down':
-            self.rect = self.image.get_rect(midtop=player.rect.midbottom +
-                                            pygame.math.Vector2(-10, 0))
-        else:
-            self.rect = self.image.get_rect(midbottom=player.rect.midtop +
-                                            pygame.math.Vector2(-10, 0))
-        # pylint: enable=c-extension-no-member
+        # follow the player's motion when drawn between updates
+        self.old_rect.update(self.rect)
+        self.old_rect.move_ip(player.old_rect.left - player.rect.left,
+                              player.old_rect.top - player.rect.top)
@@ -0,0 +1,46 @@
+"""
+This module implements object pools for short-lived sprites (ex: weapons).
+"""
+from typing import Callable
+import pygame
+
+
+class SpritePool:
+    """ Sprites that get shown and hidden instead of created and killed.
+
+        Pooled sprites join their groups once, when the pool creates them,
+        and stay there. Hidden sprites have a false "visible" attribute,
+        which drawing code skips.
+    """
+    def __init__(self, factory: Callable[[], pygame.sprite.Sprite]) -> None:
+        """ Constructor.
+
+            :param factory: creates a new sprite (already in its groups)
+            :type  factory: Callable[[], pygame.sprite.Sprite]
+        """
+        self.factory = factory
+        self.free = []  # hidden sprites ready for reuse
+        self.created = 0  # sprites made by the factory so far
+
+    def acquire(self) -> pygame.sprite.Sprite:
+        """ Get a hidden sprite from the pool and show it.
+
+            :return: pooled sprite, visible
+            :rtype:  pygame.sprite.Sprite
+        """
+        if self.free:
+            sprite = self.free.pop()
+        else:
+            sprite = self.factory()
+            self.created += 1
+        sprite.visible = True
+        return sprite
+
+    def release(self, sprite: pygame.sprite.Sprite) -> None:
+        """ Hide a sprite and return it to the pool.
+
+            :param sprite: sprite from acquire()
+            :type  sprite: pygame.sprite.Sprite
+        """
+        sprite.visible = False
+        self.free.append(sprite)
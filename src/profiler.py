@@ -0,0 +1,199 @@
+"""
+This module implements a frame profiler that times named phases of a frame.
+"""
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Dict, Optional
+import json
+
+
+PROFILE_WINDOW = 300  # frames of rolling statistics
+_NULL_SECTION = nullcontext()  # shared so disabled sections allocate nothing
+
+
+class _Section:
+    """ Context manager that adds its elapsed time to a profiler phase. """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        """ Constructor.
+
+            :param profiler: profiler to report to
+            :type  profiler: Profiler
+            :param name:     phase name
+            :type  name:     str
+        """
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.profiler.record(self.name, self.start, perf_counter())
+
+
+class Profiler:
+    """ Rolling per-phase frame timings with optional trace output.
+
+        Wrap each phase in "with profiler.section(name):" and call
+        end_frame() once per frame. Phases that run several times per frame
+        (ex: collision) are summed, and frames where a phase did not run
+        do not count toward its statistics. Disabled profilers hand out a
+        shared no-op context, so instrumented code costs a method call.
+    """
+    def __init__(self, window: int = PROFILE_WINDOW) -> None:
+        """ Constructor.
+
+            :param window: number of frames to keep statistics over
+            :type  window: int, optional
+        """
+        self.enabled = False
+        self.overlay = False  # whether the UI should draw the statistics
+        self.window = window
+        self.samples = {}  # phase -> deque of per-frame milliseconds
+        self.current = {}  # phase -> milliseconds so far this frame
+        self.frame_count = 0
+        self.origin = perf_counter()
+        self.trace_path = None
+        self.events = []  # (frame, phase, start, stop) in seconds
+
+    def reset(self) -> None:
+        """ Forget rolling statistics and the frame count. """
+        self.samples = {}
+        self.current = {}
+        self.frame_count = 0
+
+    def section(self, name: str):
+        """ Create a context manager that times a phase of the frame.
+
+            :param name: phase name
+            :type  name: str
+            :return:     context manager
+        """
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def record(self, name: str, start: float, stop: float) -> None:
+        """ Add a timed interval to a phase of the current frame.
+
+            :param name:  phase name
+            :type  name:  str
+            :param start: perf_counter() at the start of the interval
+            :type  start: float
+            :param stop:  perf_counter() at the end of the interval
+            :type  stop:  float
+        """
+        self.current[name] = self.current.get(name, 0.0) + \
+            (stop - start) * 1000
+        if self.trace_path is not None:
+            self.events.append((self.frame_count, name, start, stop))
+
+    def end_frame(self) -> None:
+        """ Move timings of the current frame into the rolling window. """
+        if not self.enabled:
+            return
+        for name, elapsed in self.current.items():
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+            self.samples[name].append(elapsed)
+        self.current = {}
+        self.frame_count += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """ Summarize the rolling window.
+
+            :return: phase -> mean, p95, p99 and max milliseconds
+            :rtype:  Dict[str, Dict[str, float]]
+        """
+        summary = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                'mean': sum(ordered) / len(ordered),
+                'p95': ordered[int(0.95 * (len(ordered) - 1))],
+                'p99': ordered[int(0.99 * (len(ordered) - 1))],
+                'max': ordered[-1]
+            }
+        return summary
+
+    def start_trace(self, path: str) -> None:
+        """ Keep every timed interval, to be written to a file on close().
+
+            :param path: output file, Chrome trace JSON if it ends in .json,
+                         CSV of per-frame phase milliseconds otherwise
+            :type  path: str
+        """
+        self.enabled = True
+        self.trace_path = path
+        self.events = []
+
+    def close(self) -> Optional[str]:
+        """ Write the trace file if tracing.
+
+            :return: path of the written trace file, if any
+            :rtype:  Optional[str]
+        """
+        if self.trace_path is None:
+            return None
+        if self.trace_path.endswith('.json'):
+            self.write_chrome_trace(self.trace_path)
+        else:
+            self.write_csv(self.trace_path)
+        path, self.trace_path, self.events = self.trace_path, None, []
+        return path
+
+    def frame_totals(self) -> Dict[int, Dict[str, float]]:
+        """ Sum traced intervals per frame and phase.
+
+            :return: frame number -> phase -> milliseconds
+            :rtype:  Dict[int, Dict[str, float]]
+        """
+        frames = {}
+        for frame, name, start, stop in self.events:
+            totals = frames.setdefault(frame, {})
+            totals[name] = totals.get(name, 0.0) + (stop - start) * 1000
+        return frames
+
+    def write_csv(self, path: str) -> None:
+        """ Write per-frame phase milliseconds as CSV (one row per frame).
+
+            :param path: output file
+            :type  path: str
+        """
+        totals = self.frame_totals()
+        names = sorted({name for frame in totals.values() for name in frame})
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(','.join(['frame_idx'] + names) + '\n')
+            for idx, frame in sorted(totals.items()):
+                row = [str(idx)] + [f'{frame.get(n, 0.0):.4f}' for n in names]
+                file.write(','.join(row) + '\n')
+
+    def write_chrome_trace(self, path: str) -> None:
+        """ Write traced intervals in Chrome trace event format.
+
+            Open the file in chrome://tracing or https://ui.perfetto.dev.
+
+            :param path: output file
+            :type  path: str
+        """
+        events = [
+            {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (stop - start) * 1e6,
+                'pid': 0,
+                'tid': 0,
+                'args': {'frame': frame}
+            }
+            for frame, name, start, stop in self.events
+        ]
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': events}, file)
+
+
+PROFILER = Profiler()  # shared by every instrumented module
@@ -0,0 +1,604 @@
+"""
+This module implements the render backends that the game draws through.
+"""
+from typing import List, Optional, Sequence, Tuple, Union
+from weakref import WeakKeyDictionary
+import math
+import pygame
+from pygame._sdl2.video import Renderer, Texture, Window
+from memory import MEMORY
+
+
+RENDER_BACKENDS = ['surface', 'texture']
+RENDER_BACKEND = 'surface'  # default, software blits onto the display
+# world resolutions relative to the window, tiles stay whole pixels at each
+RENDER_SCALES = [0.5, 0.625, 0.75, 0.875, 1.0]
+SCALE_INTERVAL = 30  # frames between dynamic render scale changes
+SCALE_MARGIN = 0.9  # fraction of the target frame time to scale up within
+# pylint: disable=no-member
+SRCALPHA = pygame.SRCALPHA
+# pylint: enable=no-member
+Color = Union[str, Tuple[int, ...], pygame.Color]  # ex: 'black', '#222'
+
+
+class SurfaceRenderer:
+    """ Software blits onto the display surface.
+
+        The screen keeps its pixels between frames, so callers can redraw
+        only the areas that changed and present just those.
+    """
+    name = 'surface'
+    retained = True  # screen pixels survive present()
+    # software upscales cost more than the pixels they save, except halving
+    scales = [0.5, 1.0]
+
+    def __init__(self, screen: pygame.Surface) -> None:
+        """ Constructor.
+
+            :param screen: display surface
+            :type  screen: pygame.Surface
+        """
+        self.screen = screen
+
+    def get_rect(self) -> pygame.Rect:
+        """ Get the screen rect, at (0, 0). """
+        return self.screen.get_rect()
+
+    @staticmethod
+    def prepare(surface: pygame.Surface,
+                alpha: bool = True) -> pygame.Surface:
+        """ Convert a loaded image to the pixel format that draws fastest.
+
+            :param surface: image as loaded
+            :type  surface: pygame.Surface
+            :param alpha:   keep per-pixel alpha (convert_alpha vs convert)
+            :type  alpha:   bool, optional
+            :return:        converted image
+            :rtype:         pygame.Surface
+        """
+        return surface.convert_alpha() if alpha else surface.convert()
+
+    def blits(self, sequence: Sequence[tuple]) -> None:
+        """ Draw images, in order.
+
+            :param sequence: (image, screen position[, image area]) to draw,
+                             positions can be rects (only top-left is used)
+            :type  sequence: Sequence[tuple]
+        """
+        self.screen.blits(sequence, doreturn=False)
+
+    def fill(self, color: Color, rect: Optional[pygame.Rect] = None) -> None:
+        """ Fill part of the screen (all of it by default) with a color. """
+        self.screen.fill(color, rect)
+
+    def draw_rect(self,
+                  color: Color,
+                  rect: pygame.Rect,
+                  width: int = 0) -> None:
+        """ Draw a filled rect, or its border if width is not 0. """
+        pygame.draw.rect(self.screen, color, rect, width)
+
+    def set_clip(self, rect: Optional[pygame.Rect]) -> None:
+        """ Limit drawing to part of the screen, None for all of it. """
+        self.screen.set_clip(rect)
+
+    def blit_scaled(self, image: pygame.Surface, rect: pygame.Rect) -> None:
+        """ Draw an image stretched to fill part of the screen.
+
+            :param image: image to draw
+            :type  image: pygame.Surface
+            :param rect:  screen area to fill
+            :type  rect:  pygame.Rect
+        """
+        pygame.transform.scale(image, rect.size, self.screen.subsurface(rect))
+
+    def changed(self,
+                surface: pygame.Surface,
+                area: Optional[pygame.Rect] = None) -> None:
+        """ Tell the renderer an image got drawn onto after it was drawn.
+
+            :param surface: image that changed
+            :type  surface: pygame.Surface
+            :param area:    part of it that changed, None for all of it
+            :type  area:    pygame.Rect, optional
+        """
+
+    def present(self, areas: Optional[List[pygame.Rect]] = None) -> None:
+        """ Show the frame.
+
+            :param areas: screen areas that changed, None for all of it
+            :type  areas: List[pygame.Rect], optional
+        """
+        if areas is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(areas)
+
+    def snapshot(self) -> pygame.Surface:
+        """ Copy the screen's current pixels (ex: for screenshots). """
+        return self.screen.copy()
+
+
+class TextureRenderer:
+    """ SDL Renderer drawing textures made from images on first use.
+
+        Textures live on the GPU when one is available, otherwise SDL's
+        software renderer draws them (ex: headless with the dummy video
+        driver). Subsurfaces draw from their parent's texture, so atlas
+        frames and floor chunks share a few textures. Every frame has to be
+        drawn in full, the screen is not kept between presents.
+    """
+    name = 'texture'
+    retained = False  # undefined screen pixels after present()
+    scales = RENDER_SCALES  # GPU stretches cost about the same at any size
+
+    def __init__(self,
+                 size: Tuple[int, int],
+                 vsync: bool = False,
+                 title: str = 'pygame') -> None:
+        """ Constructor. Opens the window.
+
+            :param size:  window width, height
+            :type  size:  Tuple[int, int]
+            :param vsync: sync presents to the monitor
+            :type  vsync: bool, optional
+            :param title: window title
+            :type  title: str, optional
+        """
+        self.window = Window(title, size)
+        self.renderer = Renderer(self.window, vsync=vsync)
+        self.size = tuple(size)
+        self.formats = {  # keeps per-pixel alpha -> pixel format to convert
+            False: pygame.Surface((1, 1), 0, 32),
+            True: pygame.Surface((1, 1), SRCALPHA, 32)
+        }
+        self.textures = WeakKeyDictionary()  # root surface -> texture
+        self.clip = None  # screen rect drawing is limited to
+
+    def get_rect(self) -> pygame.Rect:
+        """ Get the screen rect, at (0, 0). """
+        return pygame.Rect((0, 0), self.size)
+
+    def prepare(self,
+                surface: pygame.Surface,
+                alpha: bool = True) -> pygame.Surface:
+        """ Convert a loaded image to the pixel format textures are made of.
+
+            :param surface: image as loaded
+            :type  surface: pygame.Surface
+            :param alpha:   keep per-pixel alpha
+            :type  alpha:   bool, optional
+            :return:        converted image
+            :rtype:         pygame.Surface
+        """
+        return surface.convert(self.formats[alpha])
+
+    def texture(self, surface: pygame.Surface) -> Texture:
+        """ Get the texture of a (root) surface, making it on first use.
+
+            :param surface: surface that is not a subsurface
+            :type  surface: pygame.Surface
+            :return:        texture with the surface's pixels
+            :rtype:         Texture
+        """
+        texture = self.textures.get(surface)
+        if texture is None:
+            texture = Texture.from_surface(self.renderer, surface)
+            self.textures[surface] = texture
+        return texture
+
+    def blits(self, sequence: Sequence[tuple]) -> None:
+        """ Draw images, in order.
+
+            :param sequence: (image, screen position[, image area]) to draw,
+                             positions can be rects (only top-left is used)
+            :type  sequence: Sequence[tuple]
+        """
+        for image, dest, *area in sequence:
+            offset_x, offset_y = image.get_abs_offset()
+            src = pygame.Rect(area[0]).clip(image.get_rect()) if area \
+                else image.get_rect()
+            dst = pygame.Rect(dest[0], dest[1], src.width, src.height)
+            if self.clip is not None:
+                clipped = dst.clip(self.clip)
+                if not clipped.width or not clipped.height:
+                    continue
+                src = pygame.Rect(src.left + clipped.left - dst.left,
+                                  src.top + clipped.top - dst.top,
+                                  clipped.width, clipped.height)
+                dst = clipped
+            self.texture(image.get_abs_parent()).draw(
+                src.move(offset_x, offset_y), dst
+            )
+
+    def fill(self, color: Color, rect: Optional[pygame.Rect] = None) -> None:
+        """ Fill part of the screen (all of it by default) with a color. """
+        rect = self.get_rect() if rect is None else pygame.Rect(rect)
+        if self.clip is not None:
+            rect = rect.clip(self.clip)
+        self.renderer.draw_color = pygame.Color(color)
+        self.renderer.fill_rect(rect)
+
+    def draw_rect(self,
+                  color: Color,
+                  rect: pygame.Rect,
+                  width: int = 0) -> None:
+        """ Draw a filled rect, or its border if width is not 0. """
+        rect = pygame.Rect(rect)
+        if width <= 0:
+            self.fill(color, rect)
+            return
+        for edge in (
+                (rect.left, rect.top, rect.width, width),
+                (rect.left, rect.bottom - width, rect.width, width),
+                (rect.left, rect.top, width, rect.height),
+                (rect.right - width, rect.top, width, rect.height)):
+            self.fill(color, edge)
+
+    def set_clip(self, rect: Optional[pygame.Rect]) -> None:
+        """ Limit drawing to part of the screen, None for all of it. """
+        self.clip = None if rect is None else pygame.Rect(rect)
+
+    def blit_scaled(self, image: pygame.Surface, rect: pygame.Rect) -> None:
+        """ Draw an image stretched to fill part of the screen.
+
+            :param image: image to draw, a root surface
+            :type  image: pygame.Surface
+            :param rect:  screen area to fill
+            :type  rect:  pygame.Rect
+        """
+        self.texture(image).draw(None, rect)
+
+    def changed(self,
+                surface: pygame.Surface,
+                area: Optional[pygame.Rect] = None) -> None:
+        """ Tell the renderer an image got drawn onto after it was drawn.
+
+            :param surface: image that changed
+            :type  surface: pygame.Surface
+            :param area:    part of it that changed, None for all of it
+            :type  area:    pygame.Rect, optional
+        """
+        root = surface.get_abs_parent()
+        if root not in self.textures:
+            return  # made from current pixels on first use
+        offset = surface.get_abs_offset()
+        area = surface.get_rect() if area is None else pygame.Rect(area)
+        area = area.move(offset).clip(root.get_rect())
+        if area.width and area.height:
+            self.textures[root].update(root.subsurface(area), area)
+
+    def present(self, areas: Optional[List[pygame.Rect]] = None) -> None:
+        """ Show the frame, then start the next one black.
+
+            :param areas: ignored, the whole frame is shown
+            :type  areas: List[pygame.Rect], optional
+        """
+        del areas
+        self.renderer.present()
+        self.renderer.draw_color = pygame.Color('black')
+        self.renderer.clear()
+
+    def snapshot(self) -> pygame.Surface:
+        """ Copy the frame drawn so far (ex: for screenshots). """
+        return self.renderer.to_surface()
+
+
+class ScaledRenderer:
+    """ Draws at a fraction of the screen's resolution, then scales up.
+
+        Callers draw in screen coordinates with full-size images, as on the
+        screen's renderer: positions get scaled here, and images get scaled
+        copies made on first use and kept while the image lives. Drawing
+        goes to an offscreen surface that flush() stretches onto the screen
+        in one step, so fewer pixels get filled and blitted. At a scale of
+        1 everything goes straight to the screen's renderer.
+    """
+    name = 'scaled'
+
+    def __init__(self, target, scale: float = 1.0) -> None:
+        """ Constructor.
+
+            :param target: renderer of the screen
+            :type  target: SurfaceRenderer or TextureRenderer
+            :param scale:  resolution relative to the screen, up to 1
+            :type  scale:  float, optional
+        """
+        self.target = target
+        self.scale = 1.0
+        self.offscreen = None  # renderer of the scaled-down frame
+        self.scaled = {}  # scale -> image -> scaled copy
+        self.set_scale(scale)
+
+    @property
+    def retained(self) -> bool:
+        """ Whether screen pixels survive present(), only when unscaled. """
+        return self.scale == 1 and self.target.retained
+
+    def set_scale(self, scale: float) -> None:
+        """ Change the resolution to draw at (ex: to hold a frame time).
+
+            Scaled images are kept per scale, so going back to a scale
+            costs nothing.
+
+            :param scale: resolution relative to the screen, up to 1
+            :type  scale: float
+        """
+        assert 0 < scale <= 1, f'render scale {scale} not in (0, 1]'
+        self.scale = scale
+        if scale == 1:
+            self.offscreen = None
+            return
+        width, height = self.target.get_rect().size
+        self.offscreen = SurfaceRenderer(MEMORY.track(self.target.prepare(
+            pygame.Surface((round(width * scale), round(height * scale))),
+            alpha=False
+        ), 'ScaledRenderer'))
+        self.scaled.setdefault(scale, WeakKeyDictionary())
+
+    def scale_rect(self, rect: pygame.Rect) -> pygame.Rect:
+        """ Get the scaled-down area that covers a screen area.
+
+            :param rect: screen area
+            :type  rect: pygame.Rect
+            :return:     offscreen area, rounded outward
+            :rtype:      pygame.Rect
+        """
+        rect, scale = pygame.Rect(rect), self.scale
+        left, top = math.floor(rect.left * scale), math.floor(rect.top * scale)
+        return pygame.Rect(left, top,
+                           math.ceil(rect.right * scale) - left,
+                           math.ceil(rect.bottom * scale) - top)
+
+    def image(self, image: pygame.Surface) -> pygame.Surface:
+        """ Get the scaled copy of an image, making it on first use.
+
+            :param image: full-size image
+            :type  image: pygame.Surface
+            :return:      image scaled to the current scale
+            :rtype:       pygame.Surface
+        """
+        scaled = self.scaled[self.scale]
+        copy = scaled.get(image)
+        if copy is None:
+            width, height = image.get_size()
+            copy = scaled[image] = MEMORY.track(
+                pygame.transform.smoothscale(image, (
+                    max(1, round(width * self.scale)),
+                    max(1, round(height * self.scale))
+                )),
+                'ScaledRenderer'
+            )
+        return copy
+
+    def get_rect(self) -> pygame.Rect:
+        """ Get the screen rect, at (0, 0). """
+        return self.target.get_rect()
+
+    def prepare(self,
+                surface: pygame.Surface,
+                alpha: bool = True) -> pygame.Surface:
+        """ Convert a loaded image for the screen's renderer. """
+        return self.target.prepare(surface, alpha)
+
+    def blits(self, sequence: Sequence[tuple]) -> None:
+        """ Draw images, in order.
+
+            :param sequence: (image, screen position[, image area]) to draw,
+                             positions can be rects (only top-left is used)
+            :type  sequence: Sequence[tuple]
+        """
+        if self.offscreen is None:
+            self.target.blits(sequence)
+            return
+        scale = self.scale
+        self.offscreen.blits([
+            (self.image(image),
+             (round(dest[0] * scale), round(dest[1] * scale)),
+             *[self.scale_rect(rect) for rect in area])
+            for image, dest, *area in sequence
+        ])
+
+    def fill(self, color: Color, rect: Optional[pygame.Rect] = None) -> None:
+        """ Fill part of the screen (all of it by default) with a color. """
+        if self.offscreen is None:
+            self.target.fill(color, rect)
+        else:
+            self.offscreen.fill(
+                color, None if rect is None else self.scale_rect(rect)
+            )
+
+    def draw_rect(self,
+                  color: Color,
+                  rect: pygame.Rect,
+                  width: int = 0) -> None:
+        """ Draw a filled rect, or its border if width is not 0. """
+        if self.offscreen is None:
+            self.target.draw_rect(color, rect, width)
+        else:
+            self.offscreen.draw_rect(
+                color, self.scale_rect(rect),
+                width and max(1, round(width * self.scale))
+            )
+
+    def set_clip(self, rect: Optional[pygame.Rect]) -> None:
+        """ Limit drawing to part of the screen, None for all of it. """
+        if self.offscreen is None:
+            self.target.set_clip(rect)
+        else:
+            self.offscreen.set_clip(
+                None if rect is None else self.scale_rect(rect)
+            )
+
+    def changed(self,
+                surface: pygame.Surface,
+                area: Optional[pygame.Rect] = None) -> None:
+        """ Tell the renderer an image got drawn onto after it was drawn.
+
+            :param surface: image that changed
+            :type  surface: pygame.Surface
+            :param area:    part of it that changed, None for all of it
+            :type  area:    pygame.Rect, optional
+        """
+        for scaled in self.scaled.values():
+            scaled.pop(surface, None)  # scaled again on next use
+        self.target.changed(surface, area)
+
+    def flush(self) -> None:
+        """ Stretch what was drawn offscreen onto the whole screen. """
+        if self.offscreen is None:
+            return
+        frame = self.offscreen.screen
+        self.target.changed(frame)
+        self.target.blit_scaled(frame, self.target.get_rect())
+
+    def present(self, areas: Optional[List[pygame.Rect]] = None) -> None:
+        """ Show the frame (see the screen's renderer). """
+        self.target.present(areas)
+
+    def snapshot(self) -> pygame.Surface:
+        """ Copy the screen's current pixels (ex: for screenshots). """
+        return self.target.snapshot()
+
+
+class DynamicScale:
+    """ Moves a scaled renderer through its backend's scales to hold a
+        frame time.
+
+        Every SCALE_INTERVAL frames, the median frame time is predicted at
+        every scale: scales measured before predict their last median,
+        scaled along with the current scale's median since then, the
+        others one growing with the pixel count. Over the target, the
+        largest scale predicted to fit is picked, or the fastest one if
+        none does. Under it, the largest scale predicted to fit in
+        SCALE_MARGIN of the target is. So a scale that did not pay off
+        (ex: a software upscale costing more than the pixels it saved) is
+        left and not retried until the scene changes.
+    """
+    def __init__(self,
+                 renderer: ScaledRenderer,
+                 target_ms: float,
+                 interval: int = SCALE_INTERVAL) -> None:
+        """ Constructor.
+
+            :param renderer:  renderer whose scale to adjust
+            :type  renderer:  ScaledRenderer
+            :param target_ms: frame time to hold, in milliseconds
+            :type  target_ms: float
+            :param interval:  frames between scale changes
+            :type  interval:  int, optional
+        """
+        self.renderer = renderer
+        self.target_ms = target_ms
+        self.interval = interval
+        self.samples = []  # frame milliseconds since the last change
+        self.measured = {}  # scale -> last median frame milliseconds
+
+    def update(self, frame_ms: float) -> None:
+        """ Count a frame, and change the scale if it is time to.
+
+            :param frame_ms: milliseconds the frame took to simulate, draw
+                             and present (not waiting for the frame cap)
+            :type  frame_ms: float
+        """
+        self.samples.append(frame_ms)
+        if len(self.samples) < self.interval:
+            return
+        median = sorted(self.samples)[len(self.samples) // 2]
+        self.samples = []
+        scale, scales = self.renderer.scale, self.renderer.target.scales
+        # the scene got heavier or lighter by as much at the other scales
+        drift = median / self.measured.get(scale, median)
+        self.measured = {other: other_ms * drift
+                         for other, other_ms in self.measured.items()}
+        self.measured[scale] = median
+        predicted = {other: self.measured.get(other,
+                                              median * (other / scale) ** 2)
+                     for other in scales}
+        predicted[scale] = median
+        if median > self.target_ms:
+            fits = [other for other in scales
+                    if predicted[other] <= self.target_ms]
+            best = max(fits) if fits else min(scales, key=predicted.get)
+        else:
+            best = max([scale] + [
+                other for other in scales
+                if predicted[other] < self.target_ms * SCALE_MARGIN
+            ])
+        if best != scale:
+            self.renderer.set_scale(best)
+
+
+class Display:
+    """ Shared handle on the renderer of the game window. """
+    def __init__(self) -> None:
+        """ Constructor. """
+        self.renderer = None
+        self.scale = 1.0  # world resolution to start at, see world()
+        self.scaled = None  # renderer the world draws through
+
+    def open(self,
+             size: Tuple[int, int],
+             backend: str = RENDER_BACKEND,
+             vsync: bool = False,
+             title: str = 'RPG'):
+        """ Open the game window with a render backend.
+
+            :param size:    window width, height
+            :type  size:    Tuple[int, int]
+            :param backend: one of RENDER_BACKENDS
+            :type  backend: str, optional
+            :param vsync:   sync presents to the monitor
+            :type  vsync:   bool, optional
+            :param title:   window title
+            :type  title:   str, optional
+            :return:        renderer to draw through
+            :rtype:         SurfaceRenderer or TextureRenderer
+        """
+        assert backend in RENDER_BACKENDS, f'unknown backend {backend}'
+        if backend == 'texture':
+            self.renderer = TextureRenderer(size, vsync, title)
+            return self.renderer
+        if vsync:
+            # pylint: disable=no-member
+            screen = pygame.display.set_mode(size, pygame.SCALED, vsync=1)
+            # pylint: enable=no-member
+        else:
+            screen = pygame.display.set_mode(size)
+        pygame.display.set_caption(title)
+        self.renderer = SurfaceRenderer(screen)
+        return self.renderer
+
+    def get(self):
+        """ Get the renderer to draw through.
+
+            A display surface set up directly with pygame.display.set_mode
+            (ex: by scripts) gets drawn onto with a SurfaceRenderer.
+
+            :return: current renderer
+            :rtype:  SurfaceRenderer or TextureRenderer
+        """
+        screen = pygame.display.get_surface()
+        if screen is not None and \
+                getattr(self.renderer, 'screen', None) is not screen:
+            self.renderer = SurfaceRenderer(screen)
+        assert self.renderer is not None, 'display not setup'
+        return self.renderer
+
+    def world(self) -> ScaledRenderer:
+        """ Get the renderer to draw the world through.
+
+            It starts at self.scale, and keeps its own scale from then on
+            (see DynamicScale). The HUD draws through get() instead, at
+            full resolution.
+
+            :return: renderer scaling onto the current renderer
+            :rtype:  ScaledRenderer
+        """
+        renderer = self.get()
+        if self.scaled is None or self.scaled.target is not renderer:
+            self.scaled = ScaledRenderer(renderer, self.scale)
+        return self.scaled
+
+
+DISPLAY = Display()  # shared by every module that draws
@@ -0,0 +1,303 @@
+"""
+This module implements headless simulations of the level for automated
+playtesting, and a runner that spreads many of them over processes.
+
+Run it from this directory, ex:
+    python sim.py --episodes 64 --steps 2000 --agent random --output sim.json
+"""
+from multiprocessing import Pool
+from random import Random
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional
+import argparse
+import math
+import os
+import random
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no window or GPU needed
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # stdout is JSON
+# pylint: disable=wrong-import-position
+import pygame
+from controls import CONTROLS, KeyState
+from levels import Level
+from main import WIDTH, HEIGHT, SIM_RATE
+from memory import MEMORY
+from profiler import PROFILER
+from render import DISPLAY
+from utils import write_json
+# pylint: enable=wrong-import-position
+
+
+SIM_EPISODES = 8
+SIM_STEPS = 1000  # simulation steps per episode, SIM_RATE per second
+AGENT_HOLD = 10  # steps an agent holds its keys before picking again
+OBSERVE_EVERY = 0  # steps between recorded observations, 0 for final only
+# pylint: disable=no-member
+MOVE_KEYS = [pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT]
+ACTION_KEYS = [pygame.K_LSHIFT, pygame.K_LCTRL, pygame.K_q]
+# pylint: enable=no-member
+
+
+def init_headless() -> None:
+    """ Set up pygame and a (dummy) display, which loading images needs. """
+    # pylint: disable=no-member
+    pygame.init()
+    # pylint: enable=no-member
+    if DISPLAY.renderer is None and pygame.display.get_surface() is None:
+        DISPLAY.open((WIDTH, HEIGHT))
+
+
+class Simulation:
+    """ Level stepped with injected input, no window or frame clock.
+
+        Every step advances the level by 1 / SIM_RATE seconds, as the game
+        loop does, with whatever keys the caller holds down. Levels built
+        with the same seed and stepped with the same keys play out the same.
+    """
+    def __init__(self,
+                 seed: int = 0,
+                 stream: bool = False,
+                 render: bool = False) -> None:
+        """ Constructor.
+
+            :param seed:   random seed to build the level with
+            :type  seed:   int, optional
+            :param stream: only keep map regions near the player loaded
+            :type  stream: bool, optional
+            :param render: draw the level after every step, else skip drawing
+            :type  render: bool, optional
+        """
+        init_headless()
+        random.seed(seed)  # same grass variants for the same seed
+        start = perf_counter()
+        self.level = Level(stream=stream)
+        self.load_time = perf_counter() - start
+        self.render = render
+        self.steps = 0
+        self.sim_time, self.wall_time = 0.0, 0.0
+        self.distance = 0.0  # pixels the player moved
+        self.stuck_steps = 0  # steps with movement keys held but no motion
+
+    def observe(self) -> Dict:
+        """ Get the player's current state.
+
+            :return: step count, hitbox center, facing, weapon and whether
+                     the player is attacking
+            :rtype:  Dict
+        """
+        player = self.level.player
+        return {
+            'step': self.steps,
+            'pos': list(player.hitbox.center),
+            'facing': player.facing,
+            'weapon': player.weapon_idx,
+            'attacking': player.is_attacking
+        }
+
+    def step(self, keys: Iterable[int] = ()) -> None:
+        """ Advance the level by one simulation step.
+
+            :param keys: pygame key codes held down during the step
+            :type  keys: Iterable[int], optional
+        """
+        CONTROLS.keys = KeyState.of(keys)
+        before = self.level.player.hitbox.center
+        start = perf_counter()
+        self.level.update(1 / SIM_RATE)
+        if self.render:
+            self.level.draw()
+        self.wall_time += perf_counter() - start
+        after = self.level.player.hitbox.center
+        moved = math.dist(before, after)
+        self.distance += moved
+        if not moved and not self.level.player.is_still:
+            self.stuck_steps += 1
+        self.steps += 1
+        self.sim_time += 1 / SIM_RATE
+
+    def metrics(self) -> Dict:
+        """ Get counters for the steps so far.
+
+            :return: load time, steps, simulated and wall clock seconds,
+                     steps per second, distance walked and stuck steps
+            :rtype:  Dict
+        """
+        return {
+            'load_s': self.load_time,
+            'steps': self.steps,
+            'sim_s': self.sim_time,
+            'wall_s': self.wall_time,
+            'steps_per_s': self.steps / self.wall_time
+                           if self.wall_time else 0.0,
+            'distance': self.distance,
+            'stuck_steps': self.stuck_steps
+        }
+
+
+def random_agent(seed: int) -> Callable[[Dict], List[int]]:
+    """ Create an agent that walks in random directions, sometimes
+    attacking or changing weapons.
+
+    :param seed: random seed for the agent's choices
+    :type  seed: int
+    :return:     picks keys to hold from an observation
+    :rtype:      Callable[[Dict], List[int]]
+    """
+    rng, keys = Random(seed), []
+
+    def act(observation: Dict) -> List[int]:
+        nonlocal keys
+        if observation['step'] % AGENT_HOLD == 0:
+            keys = rng.sample(MOVE_KEYS, rng.randint(0, 2))
+            if rng.random() < 0.2:
+                keys.append(rng.choice(ACTION_KEYS))
+        return keys
+    return act
+
+
+def square_agent(seed: int) -> Callable[[Dict], List[int]]:
+    """ Create an agent that walks a square (right, down, left, up).
+
+    :param seed: unused, the agent is scripted
+    :type  seed: int
+    :return:     picks keys to hold from an observation
+    :rtype:      Callable[[Dict], List[int]]
+    """
+    del seed
+    # pylint: disable=no-member
+    sides = [pygame.K_RIGHT, pygame.K_DOWN, pygame.K_LEFT, pygame.K_UP]
+    # pylint: enable=no-member
+    return lambda observation: \
+        [sides[observation['step'] // AGENT_HOLD % len(sides)]]
+
+
+AGENTS = {  # name -> agent factory, by name so jobs can go to processes
+    'random': random_agent,
+    'square': square_agent
+}
+
+
+def run_episode(job: Dict) -> Dict:
+    """ Run one simulation from start to end.
+
+    :param job: 'seed', 'steps' and 'agent' (a name in AGENTS), optional
+                'stream', 'render', 'observe_every', 'profile' and 'memory'
+    :type  job: Dict
+    :return:    the job, metrics, final and recorded observations,
+                per-phase timings if profiled, and surface memory
+                accounting if asked for
+    :rtype:     Dict
+    """
+    PROFILER.enabled = job.get('profile', False)
+    PROFILER.window = job['steps']
+    MEMORY.enabled = job.get('memory', False)
+    sim = Simulation(job['seed'], job.get('stream', False),
+                     job.get('render', False))
+    PROFILER.reset()  # only time the steps
+    MEMORY.reset()
+    agent = AGENTS[job['agent']](job['seed'])
+    every = job.get('observe_every', OBSERVE_EVERY)
+    observations = []
+    for _ in range(job['steps']):
+        observation = sim.observe()
+        if every and sim.steps % every == 0:
+            observations.append(observation)
+        sim.step(agent(observation))
+        PROFILER.end_frame()
+        MEMORY.end_frame()
+    return {
+        'job': job,
+        'metrics': sim.metrics(),
+        'final': sim.observe(),
+        'observations': observations,
+        'phases_ms': PROFILER.stats() if PROFILER.enabled else None,
+        'memory': MEMORY.report() if MEMORY.enabled else None
+    }
+
+
+def run_batch(jobs: List[Dict],
+              processes: Optional[int] = None) -> List[Dict]:
+    """ Run independent simulations in parallel, one per process at a time.
+
+    Each worker process loads assets once and reuses them for every job it
+    gets, so jobs only cost building a level and stepping it.
+
+    :param jobs:      episodes to run (see run_episode)
+    :type  jobs:      List[Dict]
+    :param processes: worker processes, defaults to the number of CPUs,
+                      0 runs the jobs in this process
+    :type  processes: int, optional
+    :return:          results, in job order
+    :rtype:           List[Dict]
+    """
+    if processes == 0:
+        return [run_episode(job) for job in jobs]
+    with Pool(processes, initializer=init_headless) as pool:
+        results = pool.map(run_episode, jobs, chunksize=1)
+        # let workers exit on their own, pygame catches the SIGTERM that
+        # terminating the pool would send
+        pool.close()
+        pool.join()
+    return results
+
+
+def main() -> None:
+    """ Run a batch of simulations from the command line. """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--episodes', type=int, default=SIM_EPISODES,
+                        help='simulations to run')
+    parser.add_argument('--steps', type=int, default=SIM_STEPS,
+                        help='simulation steps per episode')
+    parser.add_argument('--agent', choices=sorted(AGENTS), default='random',
+                        help='what picks the keys to hold')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first episode, the next ones '
+                             'count up from it')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes, defaults to the CPU count, '
+                             '0 for none')
+    parser.add_argument('--stream', action='store_true',
+                        help='only keep map regions near the player loaded')
+    parser.add_argument('--render', action='store_true',
+                        help='draw every step (offscreen)')
+    parser.add_argument('--observe-every', type=int, default=OBSERVE_EVERY,
+                        help='steps between recorded observations')
+    parser.add_argument('--profile', action='store_true',
+                        help='time simulation phases in every episode')
+    parser.add_argument('--memory', action='store_true',
+                        help='track surface memory by origin in every '
+                             'episode, flagging origins that keep growing')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    jobs = [
+        {
+            'seed': args.seed + idx,
+            'steps': args.steps,
+            'agent': args.agent,
+            'stream': args.stream,
+            'render': args.render,
+            'observe_every': args.observe_every,
+            'profile': args.profile,
+            'memory': args.memory
+        }
+        for idx in range(args.episodes)
+    ]
+    start = perf_counter()
+    results = run_batch(jobs, args.processes)
+    wall_time = perf_counter() - start
+    steps = sum(result['metrics']['steps'] for result in results)
+    report = {
+        'episodes': len(results),
+        'processes': os.cpu_count() if args.processes is None
+                     else args.processes,
+        'wall_s': wall_time,
+        'steps_per_s': steps / wall_time,
+        'results': results
+    }
+    write_json(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,29 @@ This module implements tile assets for constructing level maps.
 """
 from typing import List, Tuple
 import pygame
+from memory import MEMORY
 
 
 TILE_SIZE = 64
+HITBOX_INFLATE = (0, -10)  # pixels to add/sub from the rect
+
+
+def footprint(sprite_type: str,
+              size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """ Get the map cells a tile's hitbox overlaps, relative to its own.
+
+    :param sprite_type: sprite type (see Tile)
+    :type  sprite_type: str
+    :param size:        width, height of the tile's image
+    :type  size:        Tuple[int, int]
+    :return:            first row, first column, last row, last column
+                        offsets from the tile's map cell
+    :rtype:             Tuple[int, int, int, int]
+    """
+    top = -TILE_SIZE if sprite_type == 'object' else 0  # see Tile
+    hitbox = pygame.Rect((0, top), size).inflate(HITBOX_INFLATE)
+    return hitbox.top // TILE_SIZE, hitbox.left // TILE_SIZE, \
+        (hitbox.bottom - 1) // TILE_SIZE, (hitbox.right - 1) // TILE_SIZE
 
 
 class Tile(pygame.sprite.Sprite):
@@ -26,11 +46,13 @@ class Tile(pygame.sprite.Sprite):
         :param surface:     sprite image, defaults to block square
         :type  surface:     pygame.Surface, optional
         """
-        super().__init__(groups)
-        self.image = \
-            surface or pygame.Surface((TILE_SIZE, TILE_SIZE))  # default
+        super().__init__()
+        self.image = surface or MEMORY.track(  # default
+            pygame.Surface((TILE_SIZE, TILE_SIZE)), 'Tile'
+        )
         if sprite_type == 'object':
             pos = (pos[0], pos[1] - TILE_SIZE)
         self.rect = self.image.get_rect(topleft=pos)
-        self.hitbox = self.rect.inflate(0, -10)  # pixels to add/sub
+        self.hitbox = self.rect.inflate(HITBOX_INFLATE)
         self.sprite_type = sprite_type
+        self.add(groups)  # after hitbox is set so spatial groups can index it
@@ -1,8 +1,13 @@
 """
 This module implements the user interface.
 """
+from typing import Callable, List, Optional, Tuple
 import pygame
-from player import Player
+from assets import ASSETS
+from memory import MEMORY
+from player import Player, WEAPON_DATA
+from profiler import PROFILER
+from render import DISPLAY
 
 
 UI_FONT = '../graphics/font/joystix.ttf'
@@ -21,95 +26,270 @@ MANA_COLOR = 'blue'
 
 ITEM_BOX_SIZE = 80
 
+PROFILE_OVERLAY_REFRESH = 30  # frames between profiler overlay redraws
+LOADING_BAR_SIZE = (400, 24)  # w, h
+
 
 class UserInterface:
-    """ Visual elements that indirectly relate to gameplay (ex: healthbar). """
+    """ Visual elements that indirectly relate to gameplay (ex: healthbar).
+
+        The HUD is retained: each widget is rendered into its own cached
+        surface, the size of the widget, only when the values it shows
+        change, and every frame just copies those surfaces onto the screen.
+    """
     def __init__(self) -> None:
         """ Constructor. """
-        self.display_surface = pygame.display.get_surface()
+        self.renderer = DISPLAY.get()  # draws the screen
         self.font = pygame.font.Font(UI_FONT, UI_FONT_SIZE)
         self.health_bar = pygame.Rect(*HEALTH_BOX)
         self.mana_bar = pygame.Rect(*MANA_BOX)
         self.weapon_images = []
-        for weap in ['sword', 'lance', 'axe', 'rapier', 'sai']:
-            self.weapon_images.append(
-                pygame.image.load(
-                    f'../graphics/weapons/{weap}/full.png'
-                ).convert_alpha()
+        for weapon in WEAPON_DATA:
+            self.weapon_images.append(ASSETS.image(weapon['graphic']))
+        self.surfaces = {}  # widget name -> surface it renders into
+        self.widgets = {}  # name -> (values shown, rect on screen)
+
+    def canvas(self, name: str, size: Tuple[int, int]) -> pygame.Surface:
+        """ Get a clear surface for a widget to render into.
+
+            :param name: widget name
+            :type  name: str
+            :param size: width, height of the widget
+            :type  size: Tuple[int, int]
+            :return:     the widget's surface, reused while its size stays
+            :rtype:      pygame.Surface
+        """
+        surface = self.surfaces.get(name)
+        if surface is None or surface.get_size() != size:
+            # pylint: disable=no-member
+            surface = self.surfaces[name] = MEMORY.track(
+                pygame.Surface(size, pygame.SRCALPHA), 'UserInterface'
             )
+            # pylint: enable=no-member
+        else:
+            surface.fill((0, 0, 0, 0))
+        return surface
+
+    def refresh(self,
+                name: str,
+                values: tuple,
+                render: Callable[[], pygame.Rect]) -> Optional[pygame.Rect]:
+        """ Re-render a widget into its surface if its values changed.
+
+            :param name:   widget name
+            :type  name:   str
+            :param values: everything the widget shows
+            :type  values: tuple
+            :param render: draws the widget into its surface (see canvas),
+                           returns its rect on screen
+            :type  render: Callable[[], pygame.Rect]
+            :return:       screen area that changed, None if unchanged
+            :rtype:        Optional[pygame.Rect]
+        """
+        cached = self.widgets.get(name)
+        if cached is not None and cached[0] == values:
+            return None
+        rect = render()
+        self.widgets[name] = (values, rect)
+        self.renderer.changed(self.surfaces[name])
+        return rect if cached is None else rect.union(cached[1])
 
     def display_bar(self,
+                    name: str,
                     current: float,
                     limit: float,
                     color: str,
-                    bg_rect: pygame.Rect) -> None:
-        """ Display filled stat bars (ex: health). """
-        pygame.draw.rect(self.display_surface, UI_BG_COLOR, bg_rect)
+                    bg_rect: pygame.Rect) -> pygame.Rect:
+        """ Render filled stat bars (ex: health) into their surface.
+
+            :return: rect the bar covers
+            :rtype:  pygame.Rect
+        """
+        surface = self.canvas(name, bg_rect.size)
+        local_rect = surface.get_rect()
+        pygame.draw.rect(surface, UI_BG_COLOR, local_rect)
 
         # foreground size depends on stat value
-        fg_rect = bg_rect.copy()
-        fg_rect.width = bg_rect.width * current // limit
-        pygame.draw.rect(self.display_surface, color, fg_rect)
+        fg_rect = local_rect.copy()
+        fg_rect.width = local_rect.width * current // limit
+        pygame.draw.rect(surface, color, fg_rect)
 
         # border
-        pygame.draw.rect(self.display_surface, UI_BG_COLOR, bg_rect, 3)
+        pygame.draw.rect(surface, UI_BG_COLOR, local_rect, 3)
+        return bg_rect.copy()
 
-    def display_exp(self, exp: int) -> None:
-        """ Display a rectangle w/num experience points in it.
+    def display_exp(self, exp: int) -> pygame.Rect:
+        """ Render a rectangle w/num experience points in it.
 
             :param exp: number of experience points
             :type  exp: int
+            :return:    rect the box covers
+            :rtype:     pygame.Rect
         """
-        text = self.font.render(str(exp), False, TEXT_COLOR)
+        text = MEMORY.track(self.font.render(str(exp), False, TEXT_COLOR),
+                            'UserInterface')
+        screen_rect = self.renderer.get_rect()
         rect = text.get_rect(bottomright=(
-            self.display_surface.get_size()[0] - 40,
-            self.display_surface.get_size()[1] - 40
+            screen_rect.width - 40,
+            screen_rect.height - 40
         ))
+        bg_rect = rect.inflate((20, 20))
+        surface = self.canvas('exp', bg_rect.size)
         pygame.draw.rect(
-            self.display_surface,
+            surface,
             UI_BG_COLOR,
-            rect.inflate((20, 20))
+            surface.get_rect()
         )
         pygame.draw.rect(
-            self.display_surface,
+            surface,
             UI_BORDER_COLOR,
-            rect.inflate(10, 10),
+            text.get_rect(center=surface.get_rect().center).inflate(10, 10),
             2
         )
-        self.display_surface.blit(text, rect)
+        surface.blit(text, text.get_rect(center=surface.get_rect().center))
+        return bg_rect
 
-    def display_weapon_box(self, player: Player) -> None:
-        """ Display a rectangle that shows player's current weapons.
+    def display_weapon_box(self,
+                           weapon_idx: int,
+                           can_change_weapon: bool) -> pygame.Rect:
+        """ Render a rectangle that shows player's current weapon.
 
-            :param player: the player
-            :type  player: Player
+            :param weapon_idx:        index of the player's current weapon
+            :type  weapon_idx:        int
+            :param can_change_weapon: whether weapon switching is ready
+            :type  can_change_weapon: bool
+            :return:                  rect the box covers
+            :rtype:                   pygame.Rect
         """
         bg_rect = pygame.Rect(20, 800, ITEM_BOX_SIZE, ITEM_BOX_SIZE)
-        pygame.draw.rect(self.display_surface, UI_BG_COLOR, bg_rect)
-        fg_weap = self.weapon_images[player.weapon_idx]
-        self.display_surface.blit(
+        surface = self.canvas('weapon', bg_rect.size)
+        local_rect = surface.get_rect()
+        pygame.draw.rect(surface, UI_BG_COLOR, local_rect)
+        fg_weap = self.weapon_images[weapon_idx]
+        surface.blit(
             fg_weap,
-            fg_weap.get_rect(center=bg_rect.center)
+            fg_weap.get_rect(center=local_rect.center)
         )
-        if not player.can_change_weapon:
+        if not can_change_weapon:
             pygame.draw.rect(
-                self.display_surface,
+                surface,
                 UI_BORDER_HIGHLIGHT_COLOR,
-                bg_rect,
+                local_rect,
                 3
             )
+        return bg_rect
+
+    def display_profiler(self) -> pygame.Rect:
+        """ Render rolling frame phase timings for the screen's top-right.
+
+            :return: rect the overlay covers
+            :rtype:  pygame.Rect
+        """
+        lines = [f'{"phase":<10}{"mean":>7}{"p95":>7}{"p99":>7}{"max":>7}']
+        for name, stat in sorted(PROFILER.stats().items()):
+            lines.append(
+                f'{name:<10}{stat["mean"]:>7.2f}{stat["p95"]:>7.2f}'
+                f'{stat["p99"]:>7.2f}{stat["max"]:>7.2f}'
+            )
+        texts = [
+            MEMORY.track(self.font.render(line, False, TEXT_COLOR),
+                         'UserInterface')
+            for line in lines
+        ]
 
-    def display(self, player: Player):
-        """ Master UI update function. """
-        self.display_bar(
-            player.health,
-            player.max_health,
-            HEALTH_COLOR,
-            self.health_bar)
-        self.display_bar(
-            player.mana,
-            player.max_mana,
-            MANA_COLOR,
-            self.mana_bar)
-        self.display_weapon_box(player)
-        self.display_exp(player.exp)
+        line_height = self.font.get_linesize()
+        bg_rect = pygame.Rect(
+            0, 0,
+            max(text.get_width() for text in texts) + 20,
+            line_height * len(texts) + 20
+        )
+        bg_rect.topright = (self.renderer.get_rect().width - 10, 10)
+        surface = self.canvas('profiler', bg_rect.size)
+        surface.fill(UI_BG_COLOR)
+        for idx, text in enumerate(texts):
+            surface.blit(text, (10, 10 + idx * line_height))
+        return bg_rect
+
+    def update(self, player: Player) -> List[pygame.Rect]:
+        """ Re-render HUD widgets whose values changed.
+
+            :param player: the player
+            :type  player: Player
+            :return:       screen areas whose HUD content changed
+            :rtype:        List[pygame.Rect]
+        """
+        dirty = [
+            self.refresh(
+                'health',
+                (player.health, player.max_health),
+                lambda: self.display_bar('health', player.health,
+                                         player.max_health, HEALTH_COLOR,
+                                         self.health_bar)
+            ),
+            self.refresh(
+                'mana',
+                (player.mana, player.max_mana),
+                lambda: self.display_bar('mana', player.mana,
+                                         player.max_mana, MANA_COLOR,
+                                         self.mana_bar)
+            ),
+            self.refresh(
+                'weapon',
+                (player.weapon_idx, player.can_change_weapon),
+                lambda: self.display_weapon_box(player.weapon_idx,
+                                                player.can_change_weapon)
+            ),
+            self.refresh(
+                'exp',
+                (player.exp,),
+                lambda: self.display_exp(player.exp)
+            )
+        ]
+        if PROFILER.enabled and PROFILER.overlay:
+            dirty.append(self.refresh(
+                'profiler',
+                (PROFILER.frame_count // PROFILE_OVERLAY_REFRESH,),
+                self.display_profiler
+            ))
+        elif 'profiler' in self.widgets:  # overlay just got hidden
+            _, rect = self.widgets.pop('profiler')
+            del self.surfaces['profiler']
+            dirty.append(rect)
+        return [rect for rect in dirty if rect is not None]
+
+    def draw(self) -> None:
+        """ Draw the cached HUD widgets onto the screen. """
+        self.renderer.blits([
+            (self.surfaces[name], rect)
+            for name, (_, rect) in self.widgets.items()
+        ])
+
+
+class LoadingScreen:
+    """ Progress bar shown while a level's assets load. """
+    def __init__(self) -> None:
+        """ Constructor. """
+        self.renderer = DISPLAY.get()  # draws the screen
+        self.font = pygame.font.Font(UI_FONT, UI_FONT_SIZE)
+        self.text = MEMORY.track(
+            self.font.render('Loading', False, TEXT_COLOR), 'LoadingScreen'
+        )
+        self.bar = pygame.Rect(0, 0, *LOADING_BAR_SIZE)
+        self.bar.center = self.renderer.get_rect().center
+
+    def display(self, progress: float) -> None:
+        """ Draw the loading screen.
+
+            :param progress: fraction of loading done, from 0 to 1
+            :type  progress: float
+        """
+        self.renderer.fill('black')
+        self.renderer.blits([(
+            self.text,
+            self.text.get_rect(midbottom=(self.bar.centerx, self.bar.top - 10))
+        )])
+        fg_rect = self.bar.copy()
+        fg_rect.width = int(self.bar.width * progress)
+        self.renderer.draw_rect(UI_BG_COLOR, self.bar)
+        self.renderer.draw_rect(TEXT_COLOR, fg_rect)
+        self.renderer.draw_rect(UI_BORDER_COLOR, self.bar, 2)
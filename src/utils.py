@@ -1,40 +1,66 @@
 """
 This module implements functions that are tangential to the core game engine.
 """
-from typing import List
-import os
-from glob import glob
-from csv import reader
+from functools import lru_cache
+from typing import List, Optional
+import json
+import sys
+import numpy as np
 import pygame
+from assets import ASSETS
+from atlas import atlas_frames, source_files
+from maps import compiled_layer, parse_layer
 
 
-def load_map_layer(path: str) -> List[List[int]]:
+@lru_cache(maxsize=None)
+def load_map_layer(path: str) -> np.ndarray:
     """ Load map layer stored in CSV file.
 
+    The compiled version of the layer is memory-mapped instead if it is up to
+    date (see maps.py), otherwise the CSV file is parsed. Layers are loaded
+    once and shared, so callers must not modify them.
+
     :param path: path to map layer CSV file
     :type  path: str
-    :return:     map layer
-    :rtype:      List[List[int]]
+    :return:     map layer (rows x columns), read-only
+    :rtype:      np.ndarray
     """
-    with open(path, 'r', newline='\n', encoding='utf-8') as file:
-        csvreader = reader(file, delimiter=',')
-        layer = [[int(val) for val in line] for line in csvreader]
+    layer = compiled_layer(path)
+    if layer is None:
+        layer = parse_layer(path)
+        layer.flags.writeable = False
     return layer
 
 
 def load_graphics(path: str) -> List[pygame.Surface]:
     """ Load PNG files in a directory (but not subdirectories) as surfaces.
 
+    Frames come from a packed atlas when one is up to date, otherwise each
+    file is loaded on its own. Either way they are in sorted file order and
+    shared through the asset cache, so do not draw onto them.
+
     :param path: path to directory with PNG files
     :type  path: str
     :return:     loaded images
     :rtype:      List[pygame.Surface]
     """
-    # pylint: disable=no-member
-    assert pygame.display.get_surface() is not None, 'display not setup'
-    # pylint: enable=no-member
-    template = os.path.join(path, '*.png')
-    return [
-        pygame.image.load(image_file).convert_alpha()
-        for image_file in glob(template)
-    ]
+    frames = atlas_frames(path)
+    if frames is not None:
+        return list(frames)
+    return [ASSETS.image(image_file) for image_file in source_files(path)]
+
+
+def write_json(report: dict, path: Optional[str] = None) -> None:
+    """ Write a report (ex: benchmark results) as indented JSON.
+
+    :param report: JSON-serializable report
+    :type  report: dict
+    :param path:   output file, None for stdout
+    :type  path:   str, optional
+    """
+    if path:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
@@ -0,0 +1,140 @@
+"""
+This module implements a warm-start cache of decoded level images on disk.
+
+Decoding PNG files (the floor most of all) and converting them for the
+display is most of the time it takes to build a level. After a level's
+assets load, the pixels of every image in the asset cache get written to
+one file, which the next launch memory-maps and copies into surfaces
+instead.
+"""
+from typing import List, Optional
+import hashlib
+import json
+import mmap
+import os
+from glob import glob
+import pygame
+from assets import ASSETS
+from render import DISPLAY
+
+
+WARM_CACHE_DIR = '../cache'
+WARM_CACHE_INPUTS = ['../map', '../graphics']  # cache misses if these change
+WARM_CACHE_VERSION = 1  # bump when the file layout changes
+SRCALPHA = pygame.SRCALPHA  # pylint: disable=no-member
+
+
+def input_files() -> List[str]:
+    """ List the files a level is built from, in a stable (sorted) order.
+
+    :return: paths of the files under WARM_CACHE_INPUTS
+    :rtype:  List[str]
+    """
+    return sorted(
+        path for directory in WARM_CACHE_INPUTS
+        for path in glob(os.path.join(directory, '**', '*'), recursive=True)
+        if os.path.isfile(path)
+    )
+
+
+def cache_key() -> str:
+    """ Hash the level's input files and the renderer's pixel formats.
+
+    :return: hex digest that changes whenever a cached image would
+    :rtype:  str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    renderer = DISPLAY.get()
+    digest.update(repr((
+        WARM_CACHE_VERSION, renderer.name,
+        [renderer.prepare(pygame.Surface((1, 1), SRCALPHA), alpha).get_masks()
+         for alpha in (False, True)]
+    )).encode())
+    for path in input_files():
+        digest.update(os.path.normpath(path).encode())
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def cache_path(name: str, key: str) -> str:
+    """ Get the path of a cache file, its index has .json appended.
+
+    :param name: what the cache holds (ex: 'stream' for a streamed level)
+    :type  name: str
+    :param key:  cache key (see cache_key)
+    :type  key:  str
+    :return:     path to cached pixel data
+    :rtype:      str
+    """
+    return os.path.join(WARM_CACHE_DIR, f'{name}_{key}.bin')
+
+
+def restore(name: str, key: Optional[str] = None) -> bool:
+    """ Fill the asset cache from a warm-start cache file, if one matches.
+
+    :param name: what the cache holds (see cache_path)
+    :type  name: str
+    :param key:  cache key, defaults to hashing the current inputs
+    :type  key:  str, optional
+    :return:     whether the cache was found and restored
+    :rtype:      bool
+    """
+    path = cache_path(name, key or cache_key())
+    if not os.path.exists(path) or not os.path.exists(path + '.json'):
+        return False
+    with open(path + '.json', 'r', encoding='utf-8') as file:
+        entries = json.load(file)
+    with open(path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            memoryview(data) as pixels:
+        for entry in entries:
+            surface = pygame.Surface(entry['size'], entry['flags'],
+                                     entry['bitsize'], entry['masks'])
+            if surface.get_pitch() != entry['pitch']:
+                return False  # written by another pygame/SDL build
+            offset, end = entry['offset'], entry['offset'] + entry['nbytes']
+            with memoryview(surface.get_buffer()) as target:
+                target[:] = pixels[offset:end]
+            ASSETS.put((entry['path'], entry['alpha']), surface)
+    return True
+
+
+def save(name: str, key: Optional[str] = None) -> None:
+    """ Write the images in the asset cache to a warm-start cache file.
+
+    Cache files of the same name for other keys are deleted, they are
+    outdated.
+
+    :param name: what the cache holds (see cache_path)
+    :type  name: str
+    :param key:  cache key, defaults to hashing the current inputs
+    :type  key:  str, optional
+    """
+    path = cache_path(name, key or cache_key())
+    os.makedirs(WARM_CACHE_DIR, exist_ok=True)
+    entries, offset = [], 0
+    with open(path + '.tmp', 'wb') as file:
+        for (image_path, alpha), surface in ASSETS.surfaces.items():
+            raw = surface.get_buffer().raw
+            entries.append({
+                'path': image_path,
+                'alpha': alpha,
+                'size': surface.get_size(),
+                'flags': surface.get_flags() & SRCALPHA,
+                'bitsize': surface.get_bitsize(),
+                'masks': surface.get_masks(),
+                'pitch': surface.get_pitch(),
+                'offset': offset,
+                'nbytes': len(raw)
+            })
+            file.write(raw)
+            offset += len(raw)
+    with open(path + '.json', 'w', encoding='utf-8') as file:
+        json.dump(entries, file, indent=1)
+    os.replace(path + '.tmp', path)
+    for old_path in glob(cache_path(name, '*')):
+        if old_path != path:
+            os.remove(old_path)
+            if os.path.exists(old_path + '.json'):
+                os.remove(old_path + '.json')
@@ -0,0 +1,193 @@
+"""
+This module implements streaming of large level maps in square regions.
+
+Run it as a script (from this directory) to split the floor image into one
+file per region, so regions load without decoding the whole floor:
+    python world.py
+"""
+from typing import Callable, Dict, Iterator, Optional, Tuple
+import os
+import pygame
+from assets import ASSETS
+from group import CHUNK_SIZE, FLOOR_IMAGE, grid_cells
+
+
+REGION_SIZE = CHUNK_SIZE  # side of a region in pixels, a CHUNK_SIZE multiple
+STREAM_RADIUS = 2  # regions loaded around the player's region, per side
+STREAM_LOADS = 1  # regions loaded per update, beyond the player's neighbors
+FLOOR_REGION_DIR = '../graphics/tilemap/regions'
+Key = Tuple[int, int]  # (column, row) of a region
+
+
+def region_rect(key: Key) -> pygame.Rect:
+    """ Get the world-space rect of a region.
+
+    :param key: (column, row) of the region
+    :type  key: Tuple[int, int]
+    :return:    rect in world pixels
+    :rtype:     pygame.Rect
+    """
+    return pygame.Rect(key[0] * REGION_SIZE, key[1] * REGION_SIZE,
+                       REGION_SIZE, REGION_SIZE)
+
+
+def region_floor_path(key: Key) -> str:
+    """ Get the path of the floor image file of a region.
+
+    :param key: (column, row) of the region
+    :type  key: Tuple[int, int]
+    :return:    path to region floor image file
+    :rtype:     str
+    """
+    return os.path.join(FLOOR_REGION_DIR,
+                        f'ground_{REGION_SIZE}_{key[0]}_{key[1]}.png')
+
+
+def region_floor(key: Key) -> Optional[pygame.Surface]:
+    """ Load the floor of a region into the asset cache.
+
+    Uses the region files while they are newer than the floor image (no
+    file means the region is beyond the floor). Otherwise the whole floor
+    gets loaded and cut, which works but does not keep memory bounded, so
+    run this module as a script after floor edits.
+
+    :param key: (column, row) of the region
+    :type  key: Tuple[int, int]
+    :return:    region floor, None if the region is beyond the floor image
+    :rtype:     Optional[pygame.Surface]
+    """
+    first = region_floor_path((0, 0))  # every split floor has it
+    if os.path.exists(first) and \
+            os.path.getmtime(first) >= os.path.getmtime(FLOOR_IMAGE):
+        path = region_floor_path(key)
+        return ASSETS.image(path, alpha=False) \
+            if os.path.exists(path) else None
+    floor = ASSETS.image(FLOOR_IMAGE, alpha=False)
+    area = region_rect(key).clip(floor.get_rect())
+    if not area.width or not area.height:
+        return None
+    return floor.subsurface(area)
+
+
+def split_floor() -> None:
+    """ Save the floor image as one file per region. """
+    os.makedirs(FLOOR_REGION_DIR, exist_ok=True)
+    floor = pygame.image.load(FLOOR_IMAGE)
+    for key in grid_cells(floor.get_rect(), REGION_SIZE):
+        area = region_rect(key).clip(floor.get_rect())
+        pygame.image.save(floor.subsurface(area), region_floor_path(key))
+
+
+class RegionStreamer:
+    """ Keep the regions around a point loaded and unload the rest.
+
+        Regions within STREAM_RADIUS of the point's region get loaded, the
+        ones next to it right away and the others a few per update, nearest
+        first, so crossing into a new region spreads its cost over frames.
+        Loaded regions stay until they are one region further away than
+        that, so walking back and forth over a border does not reload them.
+    """
+    def __init__(self,
+                 bounds: pygame.Rect,
+                 load: Callable[[Key], object],
+                 unload: Callable[[Key, object], None],
+                 radius: int = STREAM_RADIUS,
+                 loads_per_update: int = STREAM_LOADS) -> None:
+        """ Constructor.
+
+            :param bounds:           world-space rect of the whole map
+            :type  bounds:           pygame.Rect
+            :param load:             loads a region, returns its contents
+            :type  load:             Callable[[Key], object]
+            :param unload:           unloads a region given its contents
+            :type  unload:           Callable[[Key, object], None]
+            :param radius:           regions to load around the point
+            :type  radius:           int, optional
+            :param loads_per_update: regions to load per update beyond the
+                                     ones next to the point
+            :type  loads_per_update: int, optional
+        """
+        self.bounds = bounds
+        self.load = load
+        self.unload = unload
+        self.radius = radius
+        self.loads_per_update = loads_per_update
+        self.regions = {}  # (col, row) -> contents, for loaded regions
+        self.loads, self.evictions = 0, 0
+
+    def region_at(self, pos: Tuple[int, int]) -> Key:
+        """ Get the region containing a point.
+
+            :param pos: (x, y) in world pixels
+            :type  pos: Tuple[int, int]
+            :return:    (column, row) of the region
+            :rtype:     Tuple[int, int]
+        """
+        return pos[0] // REGION_SIZE, pos[1] // REGION_SIZE
+
+    def around(self, center: Key, radius: int) -> Iterator[Key]:
+        """ Iterate over the map's regions within a radius of a region.
+
+            :param center: (column, row) of the center region
+            :type  center: Tuple[int, int]
+            :param radius: max distance in regions (along either axis)
+            :type  radius: int
+            :return:       (column, row) region keys
+            :rtype:        Iterator[Tuple[int, int]]
+        """
+        area = region_rect(center).inflate(2 * radius * REGION_SIZE,
+                                           2 * radius * REGION_SIZE)
+        return grid_cells(area.clip(self.bounds), REGION_SIZE)
+
+    def update(self,
+               pos: Tuple[int, int],
+               budget: Optional[float] = None) -> None:
+        """ Load and unload regions for a new point (ex: player position).
+
+            :param pos:    (x, y) in world pixels
+            :type  pos:    Tuple[int, int]
+            :param budget: regions to load beyond the ones next to the point,
+                           defaults to loads_per_update (inf loads them all,
+                           ex: at level start)
+            :type  budget: float, optional
+        """
+        center = self.region_at(pos)
+
+        def distance(key: Key) -> int:
+            return max(abs(key[0] - center[0]), abs(key[1] - center[1]))
+
+        for key in [k for k in self.regions
+                    if distance(k) > self.radius + 1]:
+            self.unload(key, self.regions.pop(key))
+            self.evictions += 1
+
+        missing = sorted(
+            (key for key in self.around(center, self.radius)
+             if key not in self.regions),
+            key=distance
+        )
+        if budget is None:
+            budget = self.loads_per_update
+        for key in missing:
+            if distance(key) > 1:
+                if budget <= 0:
+                    break
+                budget -= 1
+            self.regions[key] = self.load(key)
+            self.loads += 1
+
+    def stats(self) -> Dict[str, int]:
+        """ Get streaming counters.
+
+            :return: loaded regions, region loads and evictions so far
+            :rtype:  Dict[str, int]
+        """
+        return {
+            'regions': len(self.regions),
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
+
+
+if __name__ == '__main__':
+    split_floor()
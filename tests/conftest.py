@@ -0,0 +1,14 @@
+"""
+This module sets up tests to run against src/ the way the game runs: from
+that directory (asset paths are relative to it), with no window.
+"""
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, SRC_DIR)
+os.chdir(SRC_DIR)
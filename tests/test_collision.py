@@ -0,0 +1,50 @@
+"""
+This module tests the collision grid and the obstacle group feeding it.
+"""
+import pygame
+from collision import CollisionGrid, ObstacleGroup
+
+
+def obstacle(rect: pygame.Rect) -> pygame.sprite.Sprite:
+    """ Make a bare obstacle sprite with a hitbox. """
+    sprite = pygame.sprite.Sprite()
+    sprite.hitbox = pygame.Rect(rect)
+    return sprite
+
+
+def test_moved_obstacle_collides_at_new_spot_and_kills_cleanly():
+    grid = CollisionGrid((4, 4))
+    group = ObstacleGroup(grid)
+    sprite = obstacle((10, 10, 20, 20))
+    group.add(sprite)
+
+    sprite.hitbox.move_ip(100, 100)  # into another cell
+    group.move(sprite)
+    assert grid.query(pygame.Rect(10, 10, 1, 1)) == []
+    assert grid.query(pygame.Rect(110, 110, 1, 1)) == [sprite.hitbox]
+
+    sprite.kill()
+    assert not grid.box_count.any()
+    assert not grid.boxes.any()
+
+
+def test_obstacle_moved_within_its_cell_updates_its_box():
+    grid = CollisionGrid((4, 4))
+    group = ObstacleGroup(grid)
+    sprite = obstacle((10, 10, 20, 20))
+    group.add(sprite)
+
+    sprite.hitbox.move_ip(5, 0)
+    group.move(sprite)
+    assert grid.query(pygame.Rect(10, 10, 1, 1)) == [sprite.hitbox]
+
+    sprite.kill()
+    assert not grid.box_count.any()
+
+
+def test_remove_box_ignores_boxes_not_in_the_grid():
+    grid = CollisionGrid((4, 4))
+    grid.add_box(pygame.Rect(10, 10, 20, 20))
+    grid.remove_box(pygame.Rect(70, 70, 20, 20))  # never added
+    grid.remove_box(pygame.Rect(12, 10, 20, 20))  # not as added
+    assert grid.box_count.sum() == 1
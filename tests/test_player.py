@@ -0,0 +1,20 @@
+"""
+This module tests the player's cooldowns on the simulated clock.
+"""
+import pygame
+from sim import Simulation
+
+
+def test_weapon_switch_is_ready_from_the_first_frame():
+    sim = Simulation()
+    for _ in range(3):
+        sim.step()
+        assert sim.level.player.can_change_weapon
+
+
+def test_first_frame_switches_weapon_on_q():
+    sim = Simulation()
+    sim.step([pygame.K_q])  # pylint: disable=no-member
+    assert sim.observe()['weapon'] == 1
+    sim.step()
+    assert not sim.level.player.can_change_weapon  # cooling down now
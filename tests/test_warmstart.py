@@ -0,0 +1,31 @@
+"""
+This module tests that warm launches restore the level's images.
+"""
+import main
+import warmstart
+from assets import ASSETS
+from group import FLOOR_IMAGE
+
+
+def launch(monkeypatch, cache_dir, bake_static):
+    """ Build a game's level as a launch would, without running it. """
+    monkeypatch.setattr(warmstart, 'WARM_CACHE_DIR', str(cache_dir))
+    monkeypatch.setattr(main, 'WARM_START', True)
+    monkeypatch.setattr(main, 'BAKE_STATIC', bake_static)
+    ASSETS.surfaces.clear()
+    ASSETS.size = 0
+    return main.Game()
+
+
+def test_warm_launch_restores_the_floor_image(monkeypatch, tmp_path):
+    launch(monkeypatch, tmp_path, bake_static=True)  # cold, writes cache
+    assert len(list(tmp_path.glob('*.bin'))) == 1
+
+    ASSETS.surfaces.clear()
+    ASSETS.size = 0
+    assert warmstart.restore('level_surface')
+    assert ASSETS.key(FLOOR_IMAGE, alpha=False) in ASSETS.surfaces
+
+    misses = ASSETS.misses
+    launch(monkeypatch, tmp_path, bake_static=True)  # warm
+    assert ASSETS.misses == misses  # nothing decoded from disk